@@ -0,0 +1,47 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+from server import appointment_starts_at
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+BATCH_SIZE = 500
+
+async def backfill_starts_at():
+    """Set starts_at on appointments created before the scheduler existed"""
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'healthcare')]
+
+    cursor = db.appointments.find(
+        {"starts_at": {"$exists": False}},
+        {"_id": 1, "appointment_date": 1, "appointment_time": 1}
+    )
+
+    updated = 0
+    skipped = 0
+    operations = []
+    async for appointment in cursor:
+        starts_at = appointment_starts_at(appointment.get("appointment_date"), appointment.get("appointment_time"))
+        if starts_at is None:
+            skipped += 1
+            continue
+        operations.append(UpdateOne({"_id": appointment["_id"]}, {"$set": {"starts_at": starts_at}}))
+        if len(operations) >= BATCH_SIZE:
+            await db.appointments.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+
+    if operations:
+        await db.appointments.bulk_write(operations, ordered=False)
+        updated += len(operations)
+
+    print(f"Updated {updated} appointments, skipped {skipped} with invalid date/time")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(backfill_starts_at())
@@ -0,0 +1,107 @@
+"""
+Compare JSON serialization time and payload size for 1000-item list responses.
+
+Usage: python benchmark_responses.py [items]
+
+Times jsonable_encoder (which FastAPI runs first for routes without a
+response_model), rendering its output with the default JSONResponse and
+with CompactJSONResponse, and CompactJSONResponse on the raw documents as
+the large list routes return it (no encoder pass). Reports the body size uncompressed, gzipped
+and, if the brotli package is installed, brotli-compressed at the server's
+settings. Needs no database.
+"""
+import gzip
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from server import BROTLI_QUALITY, GZIP_COMPRESS_LEVEL, CompactJSONResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def doctors(count):
+    return [
+        {
+            "user_id": str(uuid.uuid4()),
+            "specialty_id": str(uuid.uuid4()),
+            "specialty_name": "Tim mạch",
+            "bio": f"Bác sĩ chuyên khoa Tim mạch với {i % 30} năm kinh nghiệm",
+            "experience_years": i % 30,
+            "consultation_fee": 200000 + (i % 10) * 10000,
+            "status": "approved",
+            "available_slots": [{"day": "monday", "start_time": "09:00", "end_time": "17:00"}],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "user_info": {"id": str(uuid.uuid4()), "email": f"doctor{i}@example.com", "full_name": f"BS. Nguyễn Văn {i}", "role": "doctor"},
+        }
+        for i in range(count)
+    ]
+
+
+def appointments(count):
+    start = datetime.now(timezone.utc)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "patient_id": str(uuid.uuid4()),
+            "patient_name": f"Trần Thị {i}",
+            "doctor_id": str(uuid.uuid4()),
+            "doctor_name": f"BS. Phạm Minh {i % 20}",
+            "appointment_type": "online" if i % 2 else "in_person",
+            "appointment_date": (start + timedelta(days=i % 60)).strftime("%Y-%m-%d"),
+            "appointment_time": f"{9 + i % 8:02d}:00",
+            "symptoms": "Đau đầu, chóng mặt kéo dài vài ngày",
+            "status": ["pending", "confirmed", "completed", "cancelled"][i % 4],
+            "starts_at": start + timedelta(days=i % 60),
+            "created_at": start.isoformat(),
+        }
+        for i in range(count)
+    ]
+
+
+def chat_messages(count):
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "appointment_id": str(uuid.uuid4()),
+            "sender_id": str(uuid.uuid4()),
+            "sender_name": f"Lê Văn {i % 10}",
+            "message": "Xin chào bác sĩ, tôi muốn hỏi thêm về kết quả xét nghiệm hôm qua.",
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        for i in range(count)
+    ]
+
+
+def per_call_ms(func, number=20):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1000
+
+
+def main(count):
+    print(f"{count} items per response\n")
+    print(f"{'payload':<14} {'encode':>9} {'json':>9} {'orjson':>9} {'direct':>9} {'raw':>10} {'gzip':>10} {'brotli':>10}")
+    for name, build in [("doctors", doctors), ("appointments", appointments), ("chat history", chat_messages)]:
+        content = build(count)
+        encoded = jsonable_encoder(content)
+        encode_ms = per_call_ms(lambda: jsonable_encoder(content))
+        default_ms = per_call_ms(lambda: JSONResponse(encoded).body)
+        compact_ms = per_call_ms(lambda: CompactJSONResponse(encoded).body)
+        direct_ms = per_call_ms(lambda: CompactJSONResponse(content).body)
+        body = CompactJSONResponse(content).body
+        assert body == JSONResponse(encoded).body, "renderers disagree"
+        gzipped = len(gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL))
+        brotlied = f"{len(brotli.compress(body, quality=BROTLI_QUALITY)):>10,}" if brotli else f"{'n/a':>10}"
+        print(f"{name:<14} {encode_ms:>6.2f} ms {default_ms:>6.2f} ms {compact_ms:>6.2f} ms {direct_ms:>6.2f} ms {len(body):>10,} {gzipped:>10,} {brotlied}")
+    print("\nencode: jsonable_encoder; json/orjson: rendering its output; direct: orjson on the raw documents.")
+    print("Sizes are bytes. The default path costs encode + json, the list routes only direct.")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,59 @@
+"""
+Microbenchmark of access token verification with and without the
+decoded-token cache used by get_current_user_claims.
+
+Usage: python benchmark_token_cache.py [requests] [active_sessions]
+
+Simulates a steady request stream where each active session keeps sending
+the same bearer token, with a few sessions much busier than the rest.
+"""
+import logging
+import random
+import sys
+import time
+
+logging.disable(logging.WARNING)
+
+from server import access_token_cache, create_access_token, decode_access_token
+
+
+def build_workload(requests, sessions):
+    tokens = [
+        create_access_token({"sub": f"user-{i}", "role": "patient", "name": f"User {i}", "perms": None, "tv": 0})
+        for i in range(sessions)
+    ]
+    # Zipf-like popularity: a handful of sessions dominate traffic
+    weights = [1 / (rank + 1) for rank in range(sessions)]
+    rng = random.Random(42)
+    return rng.choices(tokens, weights=weights, k=requests)
+
+
+def run(workload, cached):
+    access_token_cache.clear()
+    start = time.perf_counter()
+    for token in workload:
+        if not cached:
+            access_token_cache.clear()
+        decode_access_token(token)
+    return time.perf_counter() - start
+
+
+def main(requests, sessions):
+    workload = build_workload(requests, sessions)
+    run(workload[:1000], cached=True)  # warm up imports and code paths
+
+    uncached = run(workload, cached=False)
+    cached = run(workload, cached=True)
+
+    print(f"{requests} verifications across {sessions} active sessions")
+    for name, elapsed in (("jwt.decode every request", uncached), ("decoded-token cache", cached)):
+        print(f"{name:<26} {elapsed / requests * 1e6:8.2f} us/request   "
+              f"{requests / elapsed:12,.0f} requests/s")
+    print(f"speedup: {uncached / cached:.1f}x")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    )
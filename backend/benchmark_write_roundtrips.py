@@ -0,0 +1,81 @@
+"""
+Compare update_one + find_one against a single find_one_and_update.
+
+Usage: python benchmark_write_roundtrips.py [iterations]
+
+Runs against MONGO_URL/DB_NAME in a throwaway collection that is dropped
+afterwards, so it is safe to point at a development database.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+DOCUMENTS = 1000
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<28} mean {statistics.mean(samples):7.3f} ms   "
+          f"p50 {statistics.median(samples):7.3f} ms   p95 {p95:7.3f} ms")
+
+
+async def update_then_find(collection, doc_id, value):
+    await collection.update_one({"id": doc_id}, {"$set": {"status": value}})
+    return await collection.find_one({"id": doc_id}, {"_id": 0})
+
+
+async def find_one_and_update(collection, doc_id, value):
+    return await collection.find_one_and_update(
+        {"id": doc_id},
+        {"$set": {"status": value}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def measure(collection, ids, iterations, operation):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        await operation(collection, ids[i % len(ids)], f"status-{i}")
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+async def main(iterations):
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'healthcare')]
+    collection = db[f"benchmark_{uuid.uuid4().hex[:8]}"]
+
+    try:
+        await collection.create_index("id", unique=True)
+        ids = [str(uuid.uuid4()) for _ in range(DOCUMENTS)]
+        await collection.insert_many([
+            {"id": doc_id, "status": "pending", "bio": "x" * 200} for doc_id in ids
+        ])
+
+        # Warm up connection pool and index pages
+        await measure(collection, ids, 100, find_one_and_update)
+
+        print(f"{iterations} writes against {DOCUMENTS} documents")
+        report("update_one + find_one", await measure(collection, ids, iterations, update_then_find))
+        report("find_one_and_update", await measure(collection, ids, iterations, find_one_and_update))
+    finally:
+        await collection.drop()
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
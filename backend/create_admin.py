@@ -7,6 +7,8 @@ from passlib.context import CryptContext
 import uuid
 from datetime import datetime, timezone
 
+from server import user_search_terms
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 ROOT_DIR = Path(__file__).parent
@@ -28,6 +30,8 @@ async def create_admin():
         "id": str(uuid.uuid4()),
         "email": "admin@medischedule.com",
         "username": "admin",
+        "login_keys": ["admin@medischedule.com", "admin"],
+        "search_terms": user_search_terms("Root Admin", "admin@medischedule.com", "0123456789"),
         "password": pwd_context.hash("123456"),
         "full_name": "Root Admin",
         "phone": "0123456789",
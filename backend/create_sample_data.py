@@ -7,6 +7,8 @@ from passlib.context import CryptContext
 import uuid
 from datetime import datetime, timezone
 
+from server import user_search_terms
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 ROOT_DIR = Path(__file__).parent
@@ -79,6 +81,8 @@ async def create_sample_data():
                 "id": str(uuid.uuid4()),
                 "email": patient["email"],
                 "username": patient["username"],
+                "login_keys": [patient["email"].lower(), patient["username"].lower()],
+                "search_terms": user_search_terms(patient["full_name"], patient["email"], patient["phone"]),
                 "password": pwd_context.hash(patient["password"]),
                 "full_name": patient["full_name"],
                 "role": "patient",
@@ -141,6 +145,8 @@ async def create_sample_data():
                 "id": user_id,
                 "email": doctor["email"],
                 "username": doctor["username"],
+                "login_keys": [doctor["email"].lower(), doctor["username"].lower()],
+                "search_terms": user_search_terms(doctor["full_name"], doctor["email"], doctor["phone"]),
                 "password": pwd_context.hash(doctor["password"]),
                 "full_name": doctor["full_name"],
                 "role": "doctor",
@@ -178,6 +184,8 @@ async def create_sample_data():
             "id": str(uuid.uuid4()),
             "email": dept_head_data["email"],
             "username": dept_head_data["username"],
+            "login_keys": [dept_head_data["email"].lower(), dept_head_data["username"].lower()],
+            "search_terms": user_search_terms(dept_head_data["full_name"], dept_head_data["email"], dept_head_data["phone"]),
             "password": pwd_context.hash(dept_head_data["password"]),
             "full_name": dept_head_data["full_name"],
             "role": "department_head",
@@ -0,0 +1,32 @@
+"""
+Print the route -> role/permission table for auditing.
+
+Usage: python dump_route_permissions.py [--json]
+
+Built from the same dependency walk the server runs at startup, so it
+needs no database.
+"""
+import json
+import sys
+
+from server import API_PREFIX, api_router, build_route_permission_table
+
+
+def main(as_json):
+    table = build_route_permission_table(api_router.routes, API_PREFIX)
+    if as_json:
+        print(json.dumps(table, indent=2, ensure_ascii=False))
+        return
+
+    for entry in table:
+        if not entry["authenticated"]:
+            access = "public"
+        else:
+            access = ", ".join(entry["roles"]) or "any authenticated user"
+        if entry["permissions"]:
+            access += f" [{', '.join(entry['permissions'])}]"
+        print(f"{entry['method']:<7} {entry['path']:<55} {access}")
+
+
+if __name__ == "__main__":
+    main("--json" in sys.argv[1:])
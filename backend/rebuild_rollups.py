@@ -0,0 +1,33 @@
+"""
+Rebuild the daily appointment rollups of past days from the appointments.
+
+Usage: python rebuild_rollups.py [days]
+
+Run once after deploying rollups so /admin/analytics/appointments covers
+history (default: the last 365 days, up to and including today). The
+nightly compaction job keeps them correct from then on.
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import server
+
+
+async def rebuild(days):
+    server.client = AsyncIOMotorClient(server.MONGO_URL, tz_aware=True)
+    server.db = server.client[server.DB_NAME]
+
+    today = datetime.now(server.APPOINTMENT_TIMEZONE).date()
+    for offset in range(days - 1, -1, -1):
+        day = (today - timedelta(days=offset)).isoformat()
+        count = await server.rebuild_appointment_rollups(day)
+        print(f"{day}: {count} rollups")
+
+    server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild(int(sys.argv[1]) if len(sys.argv) > 1 else 365))
@@ -1,19 +1,50 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.routing import APIRoute
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
+import csv
+import re
+import unicodedata
+import io
 import logging
+import math
+import multiprocessing
+import json
+import orjson
+import smtplib
+import socket
+import time
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr, field_validator
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union, Sequence
 import uuid
+import zlib
+import hashlib
+import base64
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import secrets
 from datetime import datetime, timezone, timedelta
+from email.message import EmailMessage
+from zoneinfo import ZoneInfo
 from passlib.context import CryptContext
+from passlib.hash import bcrypt as bcrypt_hasher
 import jwt
 from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # optional: pip install brotli-asgi
+    BrotliMiddleware = None
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -33,6 +64,22 @@ MONGO_SERVER_SELECTION_TIMEOUT = int(os.environ.get('MONGO_SERVER_SELECTION_TIME
 
 # Application Settings
 API_PREFIX = "/api"
+APPOINTMENT_TIMEZONE = ZoneInfo(os.environ.get("APPOINTMENT_TIMEZONE", "Asia/Ho_Chi_Minh"))
+APPOINTMENT_DURATION_MINUTES = int(os.environ.get("APPOINTMENT_DURATION_MINUTES", 30))
+COMPRESSION_MINIMUM_SIZE = int(os.environ.get("COMPRESSION_MINIMUM_SIZE", 1024))  # bytes
+GZIP_COMPRESS_LEVEL = int(os.environ.get("GZIP_COMPRESS_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 4))
+
+class CompactJSONResponse(JSONResponse):
+    """JSONResponse rendered by orjson, several times faster on large lists
+
+    Routes returning large lists build it themselves to also skip FastAPI's
+    jsonable_encoder pass; orjson handles Mongo documents natively and falls
+    back to jsonable_encoder for anything else.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS)
 
 # Create the main app with metadata
 app = FastAPI(
@@ -41,7 +88,8 @@ app = FastAPI(
     version="1.0.0",
     docs_url=f"{API_PREFIX}/docs",
     redoc_url=f"{API_PREFIX}/redoc",
-    openapi_url=f"{API_PREFIX}/openapi.json"
+    openapi_url=f"{API_PREFIX}/openapi.json",
+    default_response_class=CompactJSONResponse
 )
 
 # Create a router with versioned API prefix
@@ -65,6 +113,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress responses above COMPRESSION_MINIMUM_SIZE; Brotli when installed and
+# accepted by the client, gzip otherwise. Exports compress themselves, and the
+# import report is left alone so its progress lines reach the client as written.
+if BrotliMiddleware is not None:
+    app.add_middleware(
+        BrotliMiddleware,
+        quality=BROTLI_QUALITY,
+        minimum_size=COMPRESSION_MINIMUM_SIZE,
+        excluded_handlers=[f"^{API_PREFIX}/admin/users:import$", f"^{API_PREFIX}/admin/export/"],
+        gzip_fallback=True
+    )
+else:
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=COMPRESSION_MINIMUM_SIZE,
+        compresslevel=GZIP_COMPRESS_LEVEL,
+        exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES + ("application/x-ndjson",)
+    )
+
 # Database connection
 client: Optional[AsyncIOMotorClient] = None
 db: Any = None
@@ -86,7 +153,8 @@ async def startup_db_client():
         client = AsyncIOMotorClient(
             MONGO_URL,
             serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT,
-            connectTimeoutMS=MONGO_CONNECT_TIMEOUT
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT,
+            tz_aware=True
         )
         db = client[DB_NAME]
         # Verify the connection
@@ -97,6 +165,59 @@ async def startup_db_client():
         await db.users.create_index("email", unique=True)
         await db.users.create_index("username", unique=True)
         await db.users.create_index("id", unique=True)
+        await backfill_login_keys()
+        await db.users.create_index("login_keys", unique=True)
+        await backfill_user_search_terms()
+        await db.users.create_index([("role", 1), ("search_terms", 1)])
+        await db.users.create_index([("role", 1), ("created_at", -1), ("id", -1)])
+        await db.refresh_tokens.create_index("token_hash", unique=True)
+        await db.refresh_tokens.create_index("family_id")
+        await db.refresh_tokens.create_index("user_id")
+        await db.refresh_tokens.create_index("expires_at", expireAfterSeconds=0)
+        await db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+        await db.appointments.create_index("id", unique=True)
+        await db.appointments.create_index([("doctor_id", 1), ("status", 1)])
+        await db.appointments.create_index([("status", 1), ("starts_at", 1)])
+        await db.appointments.create_index("patient_id")
+        await db.appointments.create_index([("doctor_id", 1), ("starts_at", 1)])
+        await db.appointments.create_index([("doctor_id", 1), ("updated_at", -1)])
+        await db.appointments.create_index("created_at")
+        await db.appointments.create_index("appointment_date")
+        await db.appointments.create_index("updated_at")
+        await db.appointments.create_index("status_changed_at", sparse=True)
+        await db.appointment_rollups.create_index("day")
+        await db.appointment_rollups.create_index([("specialty_id", 1), ("day", 1)])
+        await db.appointment_rollups.create_index([("doctor_id", 1), ("day", 1)])
+        await move_calendar_tokens()
+        await db.calendar_feeds.create_index("token", unique=True)
+        await db.calendar_feeds.create_index("doctor_id", unique=True)
+        await db.doctor_profiles.create_index([("specialty_id", 1), ("status", 1)])
+        for sort_key in ("consultation_fee", "experience_years"):
+            await db.doctor_profiles.create_index([("status", 1), ("specialty_id", 1), (sort_key, 1)])
+            await db.doctor_profiles.create_index([("status", 1), (sort_key, 1)])
+        await db.doctor_profiles.create_index(
+            [("search_name", "text"), ("search_specialty", "text"), ("search_bio", "text")],
+            weights={"search_name": 10, "search_specialty": 5, "search_bio": 1},
+            default_language="none",
+            name="doctor_search"
+        )
+        await refresh_doctor_search({"search_name": {"$exists": False}})
+        await db.chat_messages.create_index("sender_id")
+        await db.name_propagation_jobs.create_index("user_id", unique=True)
+        # Only soft-deleted users are indexed: the purge worker's queue
+        await db.users.create_index(
+            [("deleted_at", 1)],
+            name="deleted_users",
+            partialFilterExpression={"deleted_at": {"$exists": True}}
+        )
+        await db.chat_messages.create_index("appointment_id")
+        await db.ai_chat_history.create_index("patient_id")
+        await db.outbox.create_index("id", unique=True)
+        await db.outbox.create_index([("status", 1), ("next_attempt_at", 1)])
+        await db.outbox.create_index("expires_at", expireAfterSeconds=0)
+        await db.password_reset_tokens.create_index("token_hash", unique=True)
+        await db.password_reset_tokens.create_index("user_id")
+        await db.password_reset_tokens.create_index("expires_at", expireAfterSeconds=0)
     except Exception as e:
         logger.error(f"Failed to connect to MongoDB: {e}")
         # In development, we might want to continue without MongoDB
@@ -107,6 +228,13 @@ async def startup_db_client():
 @app.on_event("shutdown")
 async def shutdown_db_client():
     global client
+    # Background jobs need the connection to release their lease
+    await scheduler.stop()
+    await name_propagation.stop()
+    await outbox_sender.stop()
+    await account_purge.stop()
+    if import_hash_pool is not None:
+        import_hash_pool.shutdown(wait=False, cancel_futures=True)
     if client:
         logger.info("Closing MongoDB connection...")
         client.close()
@@ -116,13 +244,72 @@ async def shutdown_db_client():
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+# Password hashing cost: fixed with BCRYPT_ROUNDS, otherwise calibrated once per
+# cluster to BCRYPT_TARGET_MS and shared through the settings collection
+BCRYPT_ROUNDS = os.environ.get("BCRYPT_ROUNDS")
+BCRYPT_TARGET_MS = float(os.environ.get("BCRYPT_TARGET_MS", 250))
+BCRYPT_RECALIBRATE = os.environ.get("BCRYPT_RECALIBRATE", "false").lower() == "true"
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 16
+
+def calibrate_bcrypt_rounds(target_ms: float) -> int:
+    """Pick the bcrypt cost whose hashing time on this machine is closest to target_ms"""
+    samples = []
+    for _ in range(3):
+        start = time.perf_counter()
+        bcrypt_hasher.using(rounds=BCRYPT_MIN_ROUNDS).hash("calibration-password")
+        samples.append((time.perf_counter() - start) * 1000)
+    # Every extra round doubles the work
+    rounds = BCRYPT_MIN_ROUNDS + round(math.log2(target_ms / min(samples)))
+    return max(BCRYPT_MIN_ROUNDS, min(BCRYPT_MAX_ROUNDS, rounds))
+
+def set_bcrypt_rounds(rounds: int):
+    # Pinning min and max makes needs_update() flag hashes of any other cost
+    pwd_context.update(
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds
+    )
+    logger.info(f"Password hashing uses bcrypt cost {rounds}")
+
+@app.on_event("startup")
+async def configure_password_hashing():
+    if BCRYPT_ROUNDS:
+        set_bcrypt_rounds(int(BCRYPT_ROUNDS))
+        return
+    
+    if db is not None and not BCRYPT_RECALIBRATE:
+        setting = await db.settings.find_one({"_id": "bcrypt_rounds"})
+        if setting:
+            set_bcrypt_rounds(setting["rounds"])
+            return
+    
+    rounds = await asyncio.to_thread(calibrate_bcrypt_rounds, BCRYPT_TARGET_MS)
+    if db is not None:
+        # Workers starting together each calibrate; the first stored cost wins
+        # and everyone uses it, or they would keep rehashing each other's hashes
+        calibration = {"rounds": rounds, "target_ms": BCRYPT_TARGET_MS, "calibrated_at": datetime.now(timezone.utc)}
+        try:
+            await db.settings.update_one(
+                {"_id": "bcrypt_rounds"},
+                {"$set" if BCRYPT_RECALIBRATE else "$setOnInsert": calibration},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Another worker's upsert inserted it first
+            pass
+        setting = await db.settings.find_one({"_id": "bcrypt_rounds"})
+        rounds = setting["rounds"]
+    set_bcrypt_rounds(rounds)
+
 # JWT settings
 SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 if SECRET_KEY == "your-secret-key-change-in-production":
     logger.warning("Using development JWT_SECRET_KEY. Change this in production!")
 
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", 60 * 24 * 7))  # 7 days default
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", 15))  # short-lived, renewed via /auth/refresh
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", 7))
 
 # Response Models
 class Token(BaseModel):
@@ -143,6 +330,23 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+# Keeps fire-and-forget tasks referenced until they finish
+_background_tasks: set = set()
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def rehash_password(user_id: str, plain_password: str, old_hash: str):
+    """Re-hash a password at the current bcrypt cost after a successful login"""
+    try:
+        new_hash = await asyncio.to_thread(hash_password, plain_password)
+        # Skip if the password changed in the meantime
+        await db.users.update_one({"id": user_id, "password": old_hash}, {"$set": {"password": new_hash}})
+    except Exception as e:
+        logger.error(f"Rehashing password for user {user_id} failed: {e}")
+
 def create_access_token(data: dict) -> str:
     try:
         to_encode = data.copy()
@@ -157,6 +361,192 @@ def create_access_token(data: dict) -> str:
             detail="Could not create access token"
         )
 
+def login_keys_for(email: str, username: Optional[str] = None) -> List[str]:
+    """Normalized identifiers a user can log in with"""
+    keys = [email.strip().lower()]
+    if username:
+        keys.append(username.strip().lower())
+    return keys
+
+def duplicate_user_detail(error: DuplicateKeyError, email: str) -> str:
+    """Map a users unique-index violation to the registration error message"""
+    key_value = (error.details or {}).get("keyValue") or {}
+    if "username" in key_value or key_value.get("login_keys") not in (None, email):
+        return "Tên đăng nhập đã được sử dụng"
+    return "Email đã được đăng ký"
+
+async def backfill_login_keys():
+    """Give users created before login_keys existed their keys"""
+    operations = []
+    async for user in db.users.find({"login_keys": {"$exists": False}}, {"_id": 1, "email": 1, "username": 1}):
+        operations.append(UpdateOne(
+            {"_id": user["_id"]},
+            {"$set": {"login_keys": login_keys_for(user["email"], user.get("username"))}}
+        ))
+    if operations:
+        await db.users.bulk_write(operations, ordered=False)
+        logger.info(f"Added login_keys to {len(operations)} users")
+
+# Doctor search: folded (lowercase, no Vietnamese diacritics) copies of the
+# doctor's name, specialty and bio, served by the doctor_search text index
+DOCTOR_PROFILE_PROJECTION = {"_id": 0, "search_name": 0, "search_specialty": 0, "search_bio": 0}
+
+def fold_text(text: Optional[str]) -> str:
+    """'Nguyễn Đức' -> 'nguyen duc'"""
+    # đ has no combining-mark decomposition
+    text = unicodedata.normalize("NFD", (text or "").replace("đ", "d").replace("Đ", "D"))
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+def with_prefixes(text: Optional[str]) -> str:
+    # Text indexes only match whole words; indexing prefixes makes "nguy" find "Nguyễn"
+    words = fold_text(text).split()
+    return " ".join(words + [word[:i] for word in words for i in range(2, len(word))])
+
+async def refresh_doctor_search(query: dict):
+    """Recompute the search fields of the doctor profiles matching query"""
+    profiles = await db.doctor_profiles.find(query, {"_id": 0, "user_id": 1, "specialty_id": 1, "bio": 1}).to_list(None)
+    if not profiles:
+        return
+    names = {
+        user["id"]: user["full_name"]
+        async for user in db.users.find({"id": {"$in": [p["user_id"] for p in profiles]}}, {"_id": 0, "id": 1, "full_name": 1})
+    }
+    specialties = {
+        specialty["id"]: specialty["name"]
+        async for specialty in db.specialties.find(
+            {"id": {"$in": list({p.get("specialty_id") for p in profiles})}}, {"_id": 0, "id": 1, "name": 1}
+        )
+    }
+    await db.doctor_profiles.bulk_write([
+        UpdateOne({"user_id": profile["user_id"]}, {"$set": {
+            "search_name": with_prefixes(names.get(profile["user_id"])),
+            "search_specialty": with_prefixes(specialties.get(profile.get("specialty_id"))),
+            "search_bio": fold_text(profile.get("bio"))
+        }})
+        for profile in profiles
+    ], ordered=False)
+
+# Sparse fieldsets: ?fields=a,b,c on list endpoints becomes an inclusion
+# projection, so table views read and send only the columns they show.
+# Fields computed from other collections map to the stored field they need.
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> Optional[set]:
+    """None when fields wasn't given, otherwise the validated set of field names"""
+    if fields is None:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested
+
+def sparse_projection(requested: Optional[set], default: dict, sources: Optional[dict] = None, always: Sequence[str] = ()) -> dict:
+    if requested is None:
+        return dict(default)
+    projection = {"_id": 0}
+    for field in [*requested, *always]:
+        projection[(sources or {}).get(field, field)] = 1
+    return projection
+
+def trim_fields(documents: List[dict], requested: Optional[set], always: Sequence[str] = ()):
+    """Drop the fields only loaded to compute requested ones"""
+    if requested is None:
+        return
+    keep = requested.union(always)
+    for document in documents:
+        for field in [field for field in document if field not in keep]:
+            del document[field]
+
+# Patient lists: prefix search over normalized copies of name, email and phone
+# kept in users.search_terms, paged by (created_at, id) instead of skip
+USER_LIST_PROJECTION = {"_id": 0, "password": 0, "login_keys": 0, "search_terms": 0, "token_version": 0}
+PATIENT_PAGE_SIZE = 50
+PATIENT_FIELDS = ["id", "email", "username", "full_name", "phone", "date_of_birth", "address", "role", "created_at"]
+
+def user_search_terms(full_name: Optional[str], email: str, phone: Optional[str]) -> List[str]:
+    """Prefix-searchable forms: the folded name and each of its words, the email and the phone digits"""
+    name = fold_text(full_name)
+    terms = [name, *name.split(), email.strip().lower(), re.sub(r"\D", "", phone or "")]
+    return list(dict.fromkeys(term for term in terms if term))
+
+async def backfill_user_search_terms():
+    """Give users created before search_terms existed their terms"""
+    operations = []
+    async for user in db.users.find({"search_terms": {"$exists": False}}, {"_id": 1, "full_name": 1, "email": 1, "phone": 1}):
+        operations.append(UpdateOne(
+            {"_id": user["_id"]},
+            {"$set": {"search_terms": user_search_terms(user.get("full_name"), user["email"], user.get("phone"))}}
+        ))
+    if operations:
+        await db.users.bulk_write(operations, ordered=False)
+        logger.info(f"Added search_terms to {len(operations)} users")
+
+def encode_cursor(document: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([document["created_at"], document["id"]]).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, user_id
+
+def iso_utc(value: datetime) -> str:
+    """Match the isoformat strings created_at is stored as; naive values are taken as UTC"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+async def list_patients(
+    q: Optional[str],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+    cursor: Optional[str],
+    limit: int,
+    fields: Optional[str] = None
+) -> dict:
+    """Newest patients first, limit at a time; pass next_cursor back to get the following page"""
+    requested = parse_fields(fields, PATIENT_FIELDS)
+    query = {"role": UserRole.PATIENT, "deleted_at": None}
+    if q and q.strip():
+        prefixes = {fold_text(q), q.strip().lower(), re.sub(r"\D", "", q)}
+        query["search_terms"] = {"$in": [re.compile("^" + re.escape(prefix)) for prefix in prefixes if prefix]}
+    if created_from or created_to:
+        query["created_at"] = {}
+        if created_from:
+            query["created_at"]["$gte"] = iso_utc(created_from)
+        if created_to:
+            query["created_at"]["$lt"] = iso_utc(created_to)
+    if cursor:
+        created_at, user_id = decode_cursor(cursor)
+        query["$or"] = [{"created_at": {"$lt": created_at}}, {"created_at": created_at, "id": {"$lt": user_id}}]
+    
+    # One extra row tells whether another page follows
+    # The cursor is built from created_at and id, so those are always read
+    projection = sparse_projection(requested, USER_LIST_PROJECTION, always=("id", "created_at"))
+    patients = await db.users.find(query, projection).sort([("created_at", -1), ("id", -1)]).limit(limit + 1).to_list(limit + 1)
+    next_cursor = encode_cursor(patients[limit - 1]) if len(patients) > limit else None
+    patients = patients[:limit]
+    trim_fields(patients, requested, always=("id",))
+    return {"items": patients, "next_cursor": next_cursor}
+
+def appointment_starts_at(appointment_date: str, appointment_time: str) -> Optional[datetime]:
+    """Convert the local appointment date/time strings to a UTC datetime"""
+    try:
+        local = datetime.strptime(f"{appointment_date} {appointment_time}", "%Y-%m-%d %H:%M")
+    except (TypeError, ValueError):
+        return None
+    return local.replace(tzinfo=APPOINTMENT_TIMEZONE).astimezone(timezone.utc)
+
+async def update_and_fetch(collection, query: dict, update: dict, projection: Optional[dict] = None) -> Optional[dict]:
+    """Apply an update and return the updated document in one round-trip"""
+    return await collection.find_one_and_update(
+        query,
+        update,
+        projection=projection or {"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
 # Middleware for error handling
 @app.middleware("http")
 async def error_handler(request: Request, call_next):
@@ -175,29 +565,67 @@ async def error_handler(request: Request, call_next):
         )
 
 # Authentication middleware
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db = Depends(get_database)
-) -> dict:
-    token = credentials.credentials
+def token_claims(user: dict) -> dict:
+    """Claims embedded in access tokens so most requests skip the user lookup"""
+    return {
+        "sub": user["id"],
+        "role": user["role"],
+        "name": user["full_name"],
+        "pb": compile_permissions(user.get("admin_permissions")),
+        "tv": user.get("token_version", 0),
+    }
+
+ACCESS_TOKEN_CACHE_SIZE = int(os.environ.get("ACCESS_TOKEN_CACHE_SIZE", 4096))
+
+class AccessTokenCache:
+    """Bounded LRU of verified access token payloads, keyed by token hash
+
+    The frontend sends the same bearer token on every call, so this skips
+    re-verifying its signature. Entries are dropped once the token expires.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        payload = self._entries.get(key)
+        if payload is None:
+            return None
+        if payload["exp"] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return payload
+
+    def put(self, token: str, payload: dict):
+        if self.max_size <= 0 or "exp" not in payload:
+            return
+        key = self._key(token)
+        self._entries[key] = payload
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+access_token_cache = AccessTokenCache(ACCESS_TOKEN_CACHE_SIZE)
+
+def decode_access_token(token: str) -> dict:
+    payload = access_token_cache.get(token)
+    if payload is not None:
+        return payload
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication token"
-            )
-        
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found"
-            )
-        return user
     except jwt.ExpiredSignatureError:
-        logger.warning(f"Expired token attempt for user ID: {user_id if 'user_id' in locals() else 'unknown'}")
+        logger.warning("Expired token attempt")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authentication token has expired"
@@ -208,12 +636,92 @@ async def get_current_user(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication token"
         )
-    except Exception as e:
-        logger.error(f"Authentication error: {str(e)}", exc_info=True)
+    
+    if payload.get("sub") is None:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Internal server error during authentication"
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication token"
+        )
+    access_token_cache.put(token, payload)
+    return payload
+
+def check_token_version(payload: dict, token_version: int):
+    # Tokens issued before token versions existed carry no "tv" claim
+    if "tv" in payload and payload["tv"] != token_version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authentication token has been revoked"
+        )
+
+def hash_token(token: str) -> str:
+    """Hash for refresh/reset tokens; only the hash is ever stored"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def issue_tokens(user: dict, family_id: Optional[str] = None) -> dict:
+    """Create an access token and a refresh token continuing family_id, if given"""
+    refresh_token = secrets.token_urlsafe(48)
+    now = datetime.now(timezone.utc)
+    await db.refresh_tokens.insert_one({
+        "token_hash": hash_token(refresh_token),
+        "user_id": user["id"],
+        "family_id": family_id or str(uuid.uuid4()),
+        "used": False,
+        "created_at": now,
+        "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    })
+    return {
+        "token": create_access_token(token_claims(user)),
+        "refresh_token": refresh_token,
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    }
+
+async def revoke_user_tokens(user_id: str):
+    """End every session of a user
+
+    Refresh tokens stop working immediately; access tokens already handed
+    out expire within ACCESS_TOKEN_EXPIRE_MINUTES.
+    """
+    await db.users.update_one({"id": user_id}, {"$inc": {"token_version": 1}})
+    await db.refresh_tokens.delete_many({"user_id": user_id})
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db = Depends(get_database)
+) -> dict:
+    payload = decode_access_token(credentials.credentials)
+    
+    user = await db.users.find_one({"id": payload["sub"], "deleted_at": None}, {"_id": 0, "password": 0, "login_keys": 0, "search_terms": 0})
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
         )
+    check_token_version(payload, user.get("token_version", 0))
+    return user
+
+async def get_current_user_claims(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db = Depends(get_database)
+) -> dict:
+    """Like get_current_user, but built from the token's signed claims alone
+
+    Only id, role, full_name and admin_permissions are available, and they
+    may lag behind the database until the access token is refreshed.
+    """
+    payload = decode_access_token(credentials.credentials)
+    if "tv" not in payload:
+        user = await get_current_user(credentials, db)
+        user["permission_bits"] = compile_permissions(user.get("admin_permissions"))
+        return user
+    
+    permission_bits = payload["pb"] if "pb" in payload else compile_permissions(payload.get("perms"))
+    return {
+        "id": payload["sub"],
+        "role": payload["role"],
+        "full_name": payload["name"],
+        "admin_permissions": permissions_from_bits(permission_bits),
+        "permission_bits": permission_bits,
+    }
 
 # Router will be included at the end of file after all routes are defined
 
@@ -236,6 +744,97 @@ class AdminPermissions(BaseModel):
     can_manage_specialties: bool = True
     can_create_admins: bool = False  # Only root admin should have this
 
+# Permissions
+# Roles and AdminPermissions flags are compiled to bitsets once (permissions
+# at token issue), so every check in require() is a single bitwise AND.
+ROLE_BITS = {
+    role: 1 << i
+    for i, role in enumerate([UserRole.PATIENT, UserRole.DOCTOR, UserRole.DEPARTMENT_HEAD, UserRole.ADMIN])
+}
+ROLE_LABELS = {
+    UserRole.PATIENT: "Patient",
+    UserRole.DOCTOR: "Doctor",
+    UserRole.DEPARTMENT_HEAD: "Department Head",
+    UserRole.ADMIN: "Admin",
+}
+PERMISSION_BITS = {name: 1 << i for i, name in enumerate(AdminPermissions.model_fields)}
+PERMISSION_DESCRIPTIONS = {
+    "can_manage_doctors": "manage doctors",
+    "can_manage_patients": "manage patients",
+    "can_manage_appointments": "manage appointments",
+    "can_view_stats": "view statistics",
+    "can_manage_specialties": "manage specialties",
+    "can_create_admins": "manage admin accounts",
+}
+
+def compile_permissions(permissions: Optional[dict]) -> int:
+    bits = 0
+    for name, value in (permissions or {}).items():
+        if value and name in PERMISSION_BITS:
+            bits |= PERMISSION_BITS[name]
+    return bits
+
+def permissions_from_bits(bits: int) -> Optional[dict]:
+    if not bits:
+        return None
+    return {name: bool(bits & bit) for name, bit in PERMISSION_BITS.items()}
+
+def require(role: Union[str, Sequence[str], None] = None, perm: Optional[str] = None):
+    """Dependency that returns the token's user after checking role and admin permission"""
+    roles = [role] if isinstance(role, str) else list(role or [])
+    role_mask = 0
+    for r in roles:
+        role_mask |= ROLE_BITS[r]
+    perm_mask = PERMISSION_BITS[perm] if perm else 0
+    role_detail = " or ".join(ROLE_LABELS[r] for r in roles) + " access required"
+    perm_detail = f"You don't have permission to {PERMISSION_DESCRIPTIONS[perm]}" if perm else None
+    
+    async def check(current_user: dict = Depends(get_current_user_claims)) -> dict:
+        if role_mask and not ROLE_BITS.get(current_user["role"], 0) & role_mask:
+            raise HTTPException(status_code=403, detail=role_detail)
+        if perm_mask and not current_user["permission_bits"] & perm_mask:
+            raise HTTPException(status_code=403, detail=perm_detail)
+        return current_user
+    
+    check.required_roles = roles
+    check.required_permission = perm
+    return check
+
+def route_requirements(dependant) -> dict:
+    """Roles/permission required by a route, found by walking its dependencies"""
+    requirement = {"authenticated": False, "roles": [], "permissions": []}
+    for dependency in dependant.dependencies:
+        call = dependency.call
+        if call in (get_current_user, get_current_user_claims):
+            requirement["authenticated"] = True
+        if hasattr(call, "required_roles"):
+            requirement["authenticated"] = True
+            requirement["roles"] += [r for r in call.required_roles if r not in requirement["roles"]]
+            if call.required_permission:
+                requirement["permissions"].append(call.required_permission)
+        nested = route_requirements(dependency)
+        requirement["authenticated"] = requirement["authenticated"] or nested["authenticated"]
+        requirement["roles"] += [r for r in nested["roles"] if r not in requirement["roles"]]
+        requirement["permissions"] += [p for p in nested["permissions"] if p not in requirement["permissions"]]
+    return requirement
+
+def build_route_permission_table(routes, prefix: str = "") -> List[dict]:
+    table = []
+    for route in routes:
+        if not isinstance(route, APIRoute):
+            continue
+        for method in sorted(route.methods):
+            table.append({"method": method, "path": prefix + route.path, **route_requirements(route.dependant)})
+    return sorted(table, key=lambda entry: (entry["path"], entry["method"]))
+
+route_permission_table: List[dict] = []
+
+@app.on_event("startup")
+async def build_route_permissions():
+    route_permission_table[:] = build_route_permission_table(api_router.routes, API_PREFIX)
+    public = sum(1 for entry in route_permission_table if not entry["authenticated"])
+    logger.info(f"Route permission table: {len(route_permission_table)} routes, {public} public")
+
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -335,6 +934,7 @@ class DoctorProfile(BaseModel):
     experience_years: Optional[int] = None
     consultation_fee: Optional[float] = None
     available_slots: List[dict] = []  # [{"day": "monday", "start_time": "09:00", "end_time": "17:00"}]
+    appointment_types: Optional[List[str]] = None  # None offers both in_person and online
     status: str = "pending"  # pending, approved, rejected
     is_department_head: bool = False  # Trưởng khoa flag
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -344,6 +944,14 @@ class DoctorProfileUpdate(BaseModel):
     bio: Optional[str] = None
     experience_years: Optional[int] = None
     consultation_fee: Optional[float] = None
+    appointment_types: Optional[List[str]] = None  # in_person and/or online
+    
+    @field_validator('appointment_types')
+    @classmethod
+    def validate_appointment_types(cls, v):
+        if v is not None and (not v or set(v) - {AppointmentType.IN_PERSON, AppointmentType.ONLINE}):
+            raise ValueError('appointment_types must contain in_person and/or online')
+        return v
 
 class DoctorScheduleUpdate(BaseModel):
     available_slots: List[dict]
@@ -358,6 +966,17 @@ class AppointmentStatus:
     CANCELLED = "cancelled"
     COMPLETED = "completed"
 
+    # Target status -> statuses an appointment may move from
+    TRANSITIONS = {
+        CONFIRMED: [PENDING],
+        COMPLETED: [CONFIRMED],
+        CANCELLED: [PENDING, CONFIRMED],
+    }
+
+    @classmethod
+    def allowed_from(cls, target: str) -> List[str]:
+        return cls.TRANSITIONS.get(target, [])
+
 class Appointment(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -370,6 +989,7 @@ class Appointment(BaseModel):
     appointment_time: str  # HH:MM
     symptoms: Optional[str] = None
     status: str = AppointmentStatus.PENDING
+    starts_at: Optional[datetime] = None  # appointment_date + appointment_time in UTC, used by the scheduler
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class AppointmentCreate(BaseModel):
@@ -382,6 +1002,13 @@ class AppointmentCreate(BaseModel):
 class AppointmentStatusUpdate(BaseModel):
     status: str
 
+class AppointmentStatusBatchItem(BaseModel):
+    appointment_id: str
+    status: str
+
+class AppointmentStatusBatchUpdate(BaseModel):
+    items: List[AppointmentStatusBatchItem] = Field(..., min_length=1, max_length=500)
+
 class ChatMessage(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -395,21 +1022,112 @@ class ChatMessageCreate(BaseModel):
     appointment_id: str
     message: str
 
+# Rate Limiting
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")  # "memory" or "mongo" for multi-worker deployments
+# Only enable behind a reverse proxy that appends to X-Forwarded-For
+TRUST_X_FORWARDED_FOR = os.environ.get("TRUST_X_FORWARDED_FOR", "false").lower() == "true"
+TRUSTED_PROXY_COUNT = max(1, int(os.environ.get("TRUSTED_PROXY_COUNT", 1)))  # proxies in front of the app
+
+# scope -> (burst size, tokens refilled per minute)
+RATE_LIMITS = {
+    "login:ip": (20, 10),
+    "login:account": (5, 2),
+    "forgot_password:ip": (5, 1),
+    "forgot_password:account": (3, 0.2),
+}
+
+class MemoryRateLimiter:
+    """Token buckets kept in this process"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict = OrderedDict()
+
+    async def consume(self, key: str, capacity: float, refill_per_second: float) -> float:
+        """Take one token; returns 0 if allowed, otherwise seconds until a token is available"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+        
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        
+        return 0 if allowed else (1 - tokens) / refill_per_second
+
+class MongoRateLimiter:
+    """Token buckets shared by all workers through the rate_limits collection"""
+
+    async def consume(self, key: str, capacity: float, refill_per_second: float) -> float:
+        now = datetime.now(timezone.utc)
+        # Refill, take a token and record the outcome in one atomic pipeline update
+        refilled = {"$min": [capacity, {"$add": [
+            {"$ifNull": ["$tokens", capacity]},
+            {"$multiply": [{"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}, refill_per_second]}
+        ]}]}
+        pipeline = [
+            {"$set": {"tokens": refilled, "updated_at": now}},
+            {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+            {"$set": {
+                "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                # A bucket left alone refills completely, so it can be dropped by then
+                "expires_at": now + timedelta(seconds=capacity / refill_per_second)
+            }},
+        ]
+        
+        for attempt in range(2):
+            try:
+                bucket = await db.rate_limits.find_one_and_update(
+                    {"_id": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+                )
+                break
+            except DuplicateKeyError:
+                # Two workers created the bucket at once; the retry updates it
+                if attempt:
+                    raise
+        
+        return 0 if bucket["allowed"] else (1 - bucket["tokens"]) / refill_per_second
+
+rate_limiter = MongoRateLimiter() if RATE_LIMIT_BACKEND == "mongo" else MemoryRateLimiter()
+
+def client_ip(request: Request) -> str:
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if TRUST_X_FORWARDED_FOR and forwarded_for:
+        # Clients can write any entries they like on the left; the one our
+        # outermost proxy appended sits TRUSTED_PROXY_COUNT hops from the right
+        hops = [hop.strip() for hop in forwarded_for.split(",")]
+        if len(hops) >= TRUSTED_PROXY_COUNT:
+            return hops[-TRUSTED_PROXY_COUNT]
+    return request.client.host if request.client else "unknown"
+
+async def enforce_rate_limits(request: Request, action: str, account: str):
+    """Reject with 429 when the client IP or the targeted account is over its limit"""
+    for scope, key in ((f"{action}:ip", client_ip(request)), (f"{action}:account", account)):
+        capacity, per_minute = RATE_LIMITS[scope]
+        try:
+            retry_after = await rate_limiter.consume(f"{scope}:{key}", capacity, per_minute / 60)
+        except Exception as e:
+            # Fail open: a limiter outage must not lock everybody out
+            logger.error(f"Rate limiter error: {e}")
+            return
+        
+        if retry_after > 0:
+            logger.warning(f"Rate limit hit for {scope} {key}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Bạn đã thử quá nhiều lần. Vui lòng thử lại sau {math.ceil(retry_after)} giây.",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
 # Auth Routes
 @api_router.post("/auth/register")
 async def register(user_data: UserCreate):
-    # Check if email exists
-    existing_user = await db.users.find_one({"email": user_data.email})
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email đã được đăng ký")
-    
-    # Check if username exists
-    existing_username = await db.users.find_one({"username": user_data.username})
-    if existing_username:
-        raise HTTPException(status_code=400, detail="Tên đăng nhập đã được sử dụng")
-    
     # Hash password
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await asyncio.to_thread(hash_password, user_data.password)
     
     # Create user
     user = User(
@@ -425,8 +1143,14 @@ async def register(user_data: UserCreate):
     user_dict = user.model_dump()
     user_dict["password"] = hashed_password
     user_dict["created_at"] = user_dict["created_at"].isoformat()
+    user_dict["login_keys"] = login_keys_for(user.email, user.username)
+    user_dict["search_terms"] = user_search_terms(user.full_name, user.email, user.phone)
     
-    await db.users.insert_one(user_dict)
+    # Unique indexes reject taken emails/usernames without a lookup first
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError as e:
+        raise HTTPException(status_code=400, detail=duplicate_user_detail(e, user.email))
     
     # If doctor or department_head, create profile
     if user_data.role in [UserRole.DOCTOR, UserRole.DEPARTMENT_HEAD]:
@@ -442,42 +1166,88 @@ async def register(user_data: UserCreate):
             "created_at": datetime.now(timezone.utc).isoformat()
         }
         await db.doctor_profiles.insert_one(doctor_profile)
+        await refresh_doctor_search({"user_id": doctor_profile["user_id"]})
     
-    # Create token
-    token = create_access_token({"sub": user.id, "role": user.role})
+    # Create tokens
+    tokens = await issue_tokens(user_dict)
     
     return {
-        "token": token,
+        **tokens,
         "user": user.model_dump()
     }
 
 @api_router.post("/auth/login")
-async def login(login_data: UserLogin):
-    # Try to find user by email or username
-    user = await db.users.find_one({
-        "$or": [
-            {"email": login_data.login},
-            {"username": login_data.login}
-        ]
-    }, {"_id": 0})
+async def login(login_data: UserLogin, request: Request):
+    # Throttle before any lookup or password hashing work
+    await enforce_rate_limits(request, "login", login_data.login)
+    
+    # Email or username - both are in login_keys
+    user = await db.users.find_one({"login_keys": login_data.login, "deleted_at": None}, {"_id": 0, "login_keys": 0, "search_terms": 0})
     
     if not user:
         raise HTTPException(status_code=401, detail="Email/Tên đăng nhập hoặc mật khẩu không đúng. Vui lòng kiểm tra lại!")
     
-    if not verify_password(login_data.password, user["password"]):
+    # bcrypt is CPU-bound, keep it off the event loop
+    if not await asyncio.to_thread(verify_password, login_data.password, user["password"]):
         raise HTTPException(status_code=401, detail="Email/Tên đăng nhập hoặc mật khẩu không đúng. Vui lòng kiểm tra lại!")
     
-    token = create_access_token({"sub": user["id"], "role": user["role"]})
+    if pwd_context.needs_update(user["password"]):
+        run_in_background(rehash_password(user["id"], login_data.password, user["password"]))
     
+    tokens = await issue_tokens(user)
+    
+    # Needed for the token claims only
     user.pop("password")
+    user.pop("token_version", None)
     
     return {
-        "token": token,
+        **tokens,
         "user": user
     }
 
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+@api_router.post("/auth/refresh")
+async def refresh_access_token(request: RefreshTokenRequest):
+    """Trade a refresh token for a new access token and refresh token"""
+    token_hash = hash_token(request.refresh_token)
+    now = datetime.now(timezone.utc)
+    
+    # Refresh tokens are single-use: claim it in the same write that checks it
+    stored = await db.refresh_tokens.find_one_and_update(
+        {"token_hash": token_hash, "used": False, "expires_at": {"$gt": now}},
+        {"$set": {"used": True, "used_at": now}},
+        projection={"_id": 0, "user_id": 1, "family_id": 1}
+    )
+    if stored is None:
+        reused = await db.refresh_tokens.find_one({"token_hash": token_hash, "used": True}, {"_id": 0, "family_id": 1})
+        if reused:
+            # A rotated token came back, so it probably leaked - end that session
+            logger.warning(f"Refresh token reuse detected, revoking family {reused['family_id']}")
+            await db.refresh_tokens.delete_many({"family_id": reused["family_id"]})
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    
+    user = await db.users.find_one({"id": stored["user_id"]}, {"_id": 0, "password": 0, "login_keys": 0})
+    if user is None:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    
+    return await issue_tokens(user, stored["family_id"])
+
+@api_router.post("/auth/logout")
+async def logout(request: RefreshTokenRequest):
+    """End the session the refresh token belongs to"""
+    stored = await db.refresh_tokens.find_one(
+        {"token_hash": hash_token(request.refresh_token)},
+        {"_id": 0, "family_id": 1}
+    )
+    if stored:
+        await db.refresh_tokens.delete_many({"family_id": stored["family_id"]})
+    return {"message": "Logged out"}
+
 @api_router.get("/auth/me")
 async def get_me(current_user: dict = Depends(get_current_user)):
+    current_user.pop("token_version", None)
     return current_user
 
 # Profile Update Models
@@ -543,18 +1313,29 @@ async def update_profile(
     
     if not update_data:
         raise HTTPException(status_code=400, detail="Không có thông tin nào để cập nhật")
+    if "full_name" in update_data or "phone" in update_data:
+        update_data["search_terms"] = user_search_terms(
+            update_data.get("full_name", current_user["full_name"]),
+            current_user["email"],
+            update_data.get("phone", current_user.get("phone"))
+        )
     
     # Update user
-    result = await db.users.update_one(
+    updated_user = await update_and_fetch(
+        db.users,
         {"id": user_id},
-        {"$set": update_data}
+        {"$set": update_data},
+        USER_LIST_PROJECTION
     )
     
-    if result.matched_count == 0:
+    if updated_user is None:
         raise HTTPException(status_code=404, detail="Không tìm thấy người dùng")
     
-    # Get updated user
-    updated_user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+    # Appointments and chat messages keep a copy of the name
+    if update_data.get("full_name", current_user["full_name"]) != current_user["full_name"]:
+        await name_propagation.submit(user_id, update_data["full_name"])
+        if current_user["role"] in (UserRole.DOCTOR, UserRole.DEPARTMENT_HEAD):
+            await refresh_doctor_search({"user_id": user_id})
     
     return {
         "message": "Cập nhật thông tin thành công",
@@ -565,7 +1346,7 @@ async def update_profile(
 @api_router.post("/profile/change-password")
 async def change_password(
     password_data: PasswordChangeRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """Change user password - works for all roles"""
     user_id = current_user["id"]
@@ -576,19 +1357,24 @@ async def change_password(
         raise HTTPException(status_code=404, detail="Không tìm thấy người dùng")
     
     # Verify current password
-    if not verify_password(password_data.current_password, user["password"]):
+    if not await asyncio.to_thread(verify_password, password_data.current_password, user["password"]):
         raise HTTPException(status_code=400, detail="Mật khẩu hiện tại không đúng")
     
     # Hash new password
-    new_hashed_password = hash_password(password_data.new_password)
+    new_hashed_password = await asyncio.to_thread(hash_password, password_data.new_password)
     
     # Update password
     await db.users.update_one(
         {"id": user_id},
         {"$set": {"password": new_hashed_password}}
     )
+    # Sessions opened with the old password stop working; this one gets
+    # fresh tokens carrying the new token_version so it stays signed in
+    await revoke_user_tokens(user_id)
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0, "login_keys": 0, "search_terms": 0})
+    tokens = await issue_tokens(user)
     
-    return {"message": "Đổi mật khẩu thành công"}
+    return {"message": "Đổi mật khẩu thành công", **tokens}
 
 class ForgotPasswordRequest(BaseModel):
     email: str
@@ -600,17 +1386,44 @@ class ForgotPasswordRequest(BaseModel):
             raise ValueError('Invalid email format')
         return v.lower()
 
+class ResetPasswordRequest(BaseModel):
+    token: str
+    new_password: str
+    
+    @field_validator('new_password')
+    @classmethod
+    def validate_password(cls, v):
+        return PasswordChangeRequest.validate_password(v)
+
 @api_router.post("/auth/forgot-password")
-async def forgot_password(request: ForgotPasswordRequest):
-    user = await db.users.find_one({"email": request.email})
-    if not user:
-        # Don't reveal if email exists
-        return {"message": "If email exists, reset link will be sent"}
+async def forgot_password(request: ForgotPasswordRequest, http_request: Request):
+    await enforce_rate_limits(http_request, "forgot_password", request.email)
     
-    # In production, send email with reset link
-    # For now, just return success
+    # Don't reveal if email exists: the lookup, token and email all happen in
+    # the outbox sender, so the response takes the same time either way
+    await enqueue_outbox("password_reset", {"email": request.email})
     return {"message": "If email exists, reset link will be sent"}
 
+@api_router.post("/auth/reset-password")
+async def reset_password(request: ResetPasswordRequest):
+    now = datetime.now(timezone.utc)
+    
+    # Single use: the token is claimed by the same write that validates it
+    reset = await db.password_reset_tokens.find_one_and_update(
+        {"token_hash": hash_token(request.token), "used": False, "expires_at": {"$gt": now}},
+        {"$set": {"used": True, "used_at": now}},
+        projection={"_id": 0, "user_id": 1}
+    )
+    if reset is None:
+        raise HTTPException(status_code=400, detail="Link đặt lại mật khẩu không hợp lệ hoặc đã hết hạn")
+    
+    new_hashed_password = await asyncio.to_thread(hash_password, request.new_password)
+    await db.users.update_one({"id": reset["user_id"]}, {"$set": {"password": new_hashed_password}})
+    await db.password_reset_tokens.delete_many({"user_id": reset["user_id"], "used": False})
+    await revoke_user_tokens(reset["user_id"])
+    
+    return {"message": "Đặt lại mật khẩu thành công"}
+
 # Specialty Routes
 @api_router.get("/specialties", response_model=List[Specialty])
 async def get_specialties():
@@ -618,42 +1431,131 @@ async def get_specialties():
     return specialties
 
 @api_router.post("/specialties", response_model=Specialty)
-async def create_specialty(specialty_data: SpecialtyCreate, current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
+async def create_specialty(specialty_data: SpecialtyCreate, current_user: dict = Depends(require(role=UserRole.ADMIN))):
     specialty = Specialty(**specialty_data.model_dump())
     await db.specialties.insert_one(specialty.model_dump())
     return specialty
 
 # Doctor Routes
-@api_router.get("/doctors")
-async def get_doctors(specialty_id: Optional[str] = None):
+# Listing filters and sort keys shared by /doctors and /doctors/search;
+# served by the (status, specialty_id, <sort key>) indexes
+DOCTOR_SORT_PATTERN = "^-?(consultation_fee|experience_years)$"
+DOCTOR_FIELDS = [
+    "id", "user_id", "specialty_id", "bio", "experience_years", "consultation_fee", "status",
+    "available_slots", "appointment_types", "is_department_head", "created_at",
+    "full_name", "email", "specialty_name"
+]
+DOCTOR_FIELD_SOURCES = {"full_name": "user_id", "email": "user_id", "role": "user_id", "user_info": "user_id", "specialty_name": "specialty_id"}
+
+def doctor_listing_query(
+    specialty_id: Optional[str],
+    min_fee: Optional[float],
+    max_fee: Optional[float],
+    min_experience: Optional[int],
+    appointment_type: Optional[str]
+) -> dict:
     query = {"status": "approved"}
-    
     if specialty_id:
         query["specialty_id"] = specialty_id
-    
-    doctors = await db.doctor_profiles.find(query, {"_id": 0}).to_list(1000)
-    
-    # Get user info for each doctor
+    if min_fee is not None or max_fee is not None:
+        query["consultation_fee"] = {}
+        if min_fee is not None:
+            query["consultation_fee"]["$gte"] = min_fee
+        if max_fee is not None:
+            query["consultation_fee"]["$lte"] = max_fee
+    if min_experience is not None:
+        query["experience_years"] = {"$gte": min_experience}
+    if appointment_type:
+        # Profiles that never chose their appointment types offer both
+        query["$or"] = [{"appointment_types": appointment_type}, {"appointment_types": {"$exists": False}}]
+    return query
+
+def doctor_listing_sort(sort: str) -> list:
+    field = sort.lstrip("-")
+    # user_id keeps the order stable between pages
+    return [(field, -1 if sort.startswith("-") else 1), ("user_id", 1)]
+
+async def attach_doctor_details(doctors: List[dict], fields: Optional[set] = None):
+    """Add full_name, email and specialty_name with one query each; lookups outside fields are skipped"""
+    users = {}
+    if fields is None or fields & {"full_name", "email"}:
+        users = {
+            user["id"]: user
+            async for user in db.users.find({"id": {"$in": [d["user_id"] for d in doctors]}}, {"_id": 0, "id": 1, "full_name": 1, "email": 1})
+        }
+    specialties = {}
+    if fields is None or "specialty_name" in fields:
+        specialties = {
+            specialty["id"]: specialty["name"]
+            async for specialty in db.specialties.find({"id": {"$in": list({d.get("specialty_id") for d in doctors})}}, {"_id": 0, "id": 1, "name": 1})
+        }
     for doctor in doctors:
-        user = await db.users.find_one({"id": doctor["user_id"]}, {"_id": 0, "password": 0})
+        user = users.get(doctor["user_id"])
         if user:
             doctor["full_name"] = user["full_name"]
             doctor["email"] = user["email"]
-        
-        # Get specialty name
-        if doctor.get("specialty_id"):
-            specialty = await db.specialties.find_one({"id": doctor["specialty_id"]}, {"_id": 0})
-            if specialty:
-                doctor["specialty_name"] = specialty["name"]
-    
+        if doctor.get("specialty_id") in specialties:
+            doctor["specialty_name"] = specialties[doctor["specialty_id"]]
+
+@api_router.get("/doctors")
+async def get_doctors(
+    specialty_id: Optional[str] = None,
+    sort: Optional[str] = Query(None, pattern=DOCTOR_SORT_PATTERN),
+    min_fee: Optional[float] = Query(None, ge=0),
+    max_fee: Optional[float] = Query(None, ge=0),
+    min_experience: Optional[int] = Query(None, ge=0),
+    appointment_type: Optional[str] = Query(None, pattern="^(in_person|online)$"),
+    fields: Optional[str] = None
+):
+    requested = parse_fields(fields, DOCTOR_FIELDS)
+    query = doctor_listing_query(specialty_id, min_fee, max_fee, min_experience, appointment_type)
+    cursor = db.doctor_profiles.find(query, sparse_projection(requested, DOCTOR_PROFILE_PROJECTION, DOCTOR_FIELD_SOURCES, ("user_id",)))
+    if sort:
+        cursor = cursor.sort(doctor_listing_sort(sort))
+    doctors = await cursor.to_list(1000)
+    
+    await attach_doctor_details(doctors, requested)
+    trim_fields(doctors, requested, ("user_id",))
     return doctors
 
+@api_router.get("/doctors/search")
+async def search_doctors(
+    q: str = "",
+    specialty_id: Optional[str] = None,
+    sort: Optional[str] = Query(None, pattern=DOCTOR_SORT_PATTERN),
+    min_fee: Optional[float] = Query(None, ge=0),
+    max_fee: Optional[float] = Query(None, ge=0),
+    min_experience: Optional[int] = Query(None, ge=0),
+    appointment_type: Optional[str] = Query(None, pattern="^(in_person|online)$"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    fields: Optional[str] = None
+):
+    """Accent-insensitive search over doctor name, specialty and bio, best matches first"""
+    requested = parse_fields(fields, DOCTOR_FIELDS)
+    query = doctor_listing_query(specialty_id, min_fee, max_fee, min_experience, appointment_type)
+    
+    projection = sparse_projection(requested, DOCTOR_PROFILE_PROJECTION, DOCTOR_FIELD_SOURCES, ("user_id",))
+    order = [("created_at", -1)]
+    terms = fold_text(q)
+    if terms:
+        query["$text"] = {"$search": terms}
+        projection["score"] = {"$meta": "textScore"}
+        order = [("score", {"$meta": "textScore"})]
+    if sort:
+        # An explicit sort wins over relevance
+        order = doctor_listing_sort(sort)
+    
+    total = await db.doctor_profiles.count_documents(query)
+    doctors = await db.doctor_profiles.find(query, projection).sort(order).skip((page - 1) * page_size).limit(page_size).to_list(page_size)
+    
+    await attach_doctor_details(doctors, requested)
+    trim_fields(doctors, requested, ("user_id", "score"))
+    return {"items": doctors, "total": total, "page": page, "page_size": page_size}
+
 @api_router.get("/doctors/{doctor_id}")
 async def get_doctor(doctor_id: str):
-    doctor = await db.doctor_profiles.find_one({"user_id": doctor_id}, {"_id": 0})
+    doctor = await db.doctor_profiles.find_one({"user_id": doctor_id}, DOCTOR_PROFILE_PROJECTION)
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
     
@@ -671,46 +1573,46 @@ async def get_doctor(doctor_id: str):
     return doctor
 
 @api_router.put("/doctors/profile")
-async def update_doctor_profile(profile_data: DoctorProfileUpdate, current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != UserRole.DOCTOR:
-        raise HTTPException(status_code=403, detail="Doctor access required")
-    
+async def update_doctor_profile(profile_data: DoctorProfileUpdate, current_user: dict = Depends(require(role=UserRole.DOCTOR))):
     update_data = {k: v for k, v in profile_data.model_dump().items() if v is not None}
     
     if update_data:
-        await db.doctor_profiles.update_one(
+        doctor = await update_and_fetch(
+            db.doctor_profiles,
             {"user_id": current_user["id"]},
-            {"$set": update_data}
+            {"$set": update_data},
+            DOCTOR_PROFILE_PROJECTION
         )
+        if "bio" in update_data or "specialty_id" in update_data:
+            await refresh_doctor_search({"user_id": current_user["id"]})
+        if "specialty_id" in update_data:
+            department_cache.invalidate(current_user["id"])
+        return doctor
     
-    doctor = await db.doctor_profiles.find_one({"user_id": current_user["id"]}, {"_id": 0})
+    doctor = await db.doctor_profiles.find_one({"user_id": current_user["id"]}, DOCTOR_PROFILE_PROJECTION)
     return doctor
 
 @api_router.put("/doctors/schedule")
-async def update_doctor_schedule(schedule_data: DoctorScheduleUpdate, current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != UserRole.DOCTOR:
-        raise HTTPException(status_code=403, detail="Doctor access required")
-    
-    await db.doctor_profiles.update_one(
+async def update_doctor_schedule(schedule_data: DoctorScheduleUpdate, current_user: dict = Depends(require(role=UserRole.DOCTOR))):
+    doctor = await update_and_fetch(
+        db.doctor_profiles,
         {"user_id": current_user["id"]},
-        {"$set": {"available_slots": schedule_data.available_slots}}
+        {"$set": {"available_slots": schedule_data.available_slots}},
+        DOCTOR_PROFILE_PROJECTION
     )
-    
-    doctor = await db.doctor_profiles.find_one({"user_id": current_user["id"]}, {"_id": 0})
     return doctor
 
 # Appointment Routes
-@api_router.post("/appointments", response_model=Appointment)
+@api_router.post("/appointments", response_model=Appointment, dependencies=[Depends(require(role=UserRole.PATIENT))])
 async def create_appointment(appointment_data: AppointmentCreate, current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != UserRole.PATIENT:
-        raise HTTPException(status_code=403, detail="Patient access required")
-    
     appointment = Appointment(
         patient_id=current_user["id"],
         patient_name=current_user["full_name"],
         **appointment_data.model_dump()
     )
     
+    appointment.starts_at = appointment_starts_at(appointment.appointment_date, appointment.appointment_time)
+    
     # Get doctor name
     doctor = await db.users.find_one({"id": appointment_data.doctor_id}, {"_id": 0})
     if doctor:
@@ -718,12 +1620,15 @@ async def create_appointment(appointment_data: AppointmentCreate, current_user:
     
     doc = appointment.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
+    doc["updated_at"] = doc["created_at"]
     
     await db.appointments.insert_one(doc)
+    department_analytics_cache.invalidate_doctor(appointment.doctor_id)
+    await record_appointment_events([(appointment.doctor_id, appointment.appointment_type, "created")])
     return appointment
 
 @api_router.get("/appointments/my")
-async def get_my_appointments(current_user: dict = Depends(get_current_user)):
+async def get_my_appointments(current_user: dict = Depends(get_current_user_claims)):
     if current_user["role"] == UserRole.PATIENT:
         appointments = await db.appointments.find({"patient_id": current_user["id"]}, {"_id": 0}).to_list(1000)
     elif current_user["role"] == UserRole.DOCTOR:
@@ -734,31 +1639,256 @@ async def get_my_appointments(current_user: dict = Depends(get_current_user)):
     # Sort by date and time (newest first)
     appointments.sort(key=lambda x: (x.get("appointment_date", ""), x.get("appointment_time", "")), reverse=True)
     
-    return appointments
+    return CompactJSONResponse(appointments)
 
 @api_router.put("/appointments/{appointment_id}/status")
 async def update_appointment_status(
     appointment_id: str,
     status_data: AppointmentStatusUpdate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(require(role=UserRole.DOCTOR))
 ):
-    if current_user["role"] != UserRole.DOCTOR:
-        raise HTTPException(status_code=403, detail="Doctor access required")
-    
-    appointment = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
-    if not appointment:
-        raise HTTPException(status_code=404, detail="Appointment not found")
+    allowed_from = AppointmentStatus.allowed_from(status_data.status)
+    if not allowed_from:
+        raise HTTPException(status_code=400, detail=f"Invalid status: {status_data.status}")
+    
+    now = datetime.now(timezone.utc).isoformat()
+    updated = await update_and_fetch(
+        db.appointments,
+        # Same state machine as the batch endpoint, so finished appointments can't
+        # flip back and forth and rollups count each outcome once
+        {"id": appointment_id, "doctor_id": current_user["id"], "status": {"$in": allowed_from}},
+        {"$set": {"status": status_data.status, "updated_at": now, "status_changed_at": now}}
+    )
+    department_analytics_cache.invalidate_doctor(current_user["id"])
+    if updated is None:
+        # Nothing matched - find out whether it is missing, someone else's, unchanged or not allowed
+        appointment = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
+        if not appointment:
+            raise HTTPException(status_code=404, detail="Appointment not found")
+        if appointment["doctor_id"] != current_user["id"]:
+            raise HTTPException(status_code=403, detail="Not your appointment")
+        if appointment["status"] != status_data.status:
+            raise HTTPException(status_code=400, detail=f"Cannot change status from {appointment['status']} to {status_data.status}")
+        return appointment
+    
+    if status_data.status in ROLLUP_EVENTS:
+        await record_appointment_events([(updated["doctor_id"], updated["appointment_type"], ROLLUP_EVENTS[status_data.status])])
+    return updated
+
+@api_router.put("/appointments/status:batch")
+async def batch_update_appointment_status(
+    batch_data: AppointmentStatusBatchUpdate,
+    current_user: dict = Depends(require(role=UserRole.DOCTOR))
+):
+    """Confirm/complete/cancel many appointments at once"""
+    updated_at = datetime.now(timezone.utc).isoformat()
+    results: Dict[str, dict] = {}
+    targets: Dict[str, str] = {}
+    ids_by_target: Dict[str, List[str]] = {}
+
+    appointment_ids = [item.appointment_id for item in batch_data.items]
+    if len(set(appointment_ids)) != len(appointment_ids):
+        raise HTTPException(status_code=400, detail="Each appointment may only appear once per batch")
+
+    for item in batch_data.items:
+        allowed_from = AppointmentStatus.allowed_from(item.status)
+        if not allowed_from:
+            results[item.appointment_id] = {
+                "appointment_id": item.appointment_id,
+                "result": "invalid_status",
+                "detail": f"Invalid status: {item.status}"
+            }
+            continue
+
+        results[item.appointment_id] = None
+        targets[item.appointment_id] = item.status
+        ids_by_target.setdefault(item.status, []).append(item.appointment_id)
+
+    # Ownership and the state machine live in the filters, so no reads are
+    # needed. One write per target status and appointment type: their
+    # modified counts are exactly what the rollups need
+    known_types = [AppointmentType.IN_PERSON, AppointmentType.ONLINE]
+    writes = [
+        (target, appointment_type, {
+            "id": {"$in": ids},
+            "doctor_id": current_user["id"],
+            "status": {"$in": AppointmentStatus.allowed_from(target)},
+            "appointment_type": appointment_type or {"$nin": known_types}
+        })
+        for target, ids in ids_by_target.items()
+        for appointment_type in [*known_types, None]
+    ]
+    counts = await asyncio.gather(*[
+        db.appointments.update_many(query, {"$set": {"status": target, "updated_at": updated_at, "status_changed_at": updated_at}})
+        for target, _, query in writes
+    ])
+    modified = sum(result.modified_count for result in counts)
+    if writes:
+        department_analytics_cache.invalidate_doctor(current_user["id"])
+
+    pending_ids = [aid for aid, result in results.items() if result is None]
+    if modified == len(pending_ids):
+        for aid in pending_ids:
+            results[aid] = {"appointment_id": aid, "result": "updated", "status": targets[aid]}
+    else:
+        # Only look appointments up again to explain the updates that did not match
+        appointments = await db.appointments.find(
+            {"id": {"$in": pending_ids}},
+            {"_id": 0, "id": 1, "doctor_id": 1, "status": 1, "updated_at": 1}
+        ).to_list(len(pending_ids))
+        found = {a["id"]: a for a in appointments}
+
+        for aid in pending_ids:
+            appointment = found.get(aid)
+            if not appointment:
+                results[aid] = {"appointment_id": aid, "result": "not_found", "detail": "Appointment not found"}
+            elif appointment["doctor_id"] != current_user["id"]:
+                results[aid] = {"appointment_id": aid, "result": "forbidden", "detail": "Not your appointment"}
+            elif appointment["status"] == targets[aid] and appointment.get("updated_at") == updated_at:
+                results[aid] = {"appointment_id": aid, "result": "updated", "status": targets[aid]}
+            else:
+                results[aid] = {
+                    "appointment_id": aid,
+                    "result": "invalid_transition",
+                    "detail": f"Cannot change status from {appointment['status']} to {targets[aid]}"
+                }
+
+    events = []
+    for (target, appointment_type, query), result in zip(writes, counts):
+        if target not in ROLLUP_EVENTS or not result.modified_count:
+            continue
+        if appointment_type:
+            events += [(current_user["id"], appointment_type, ROLLUP_EVENTS[target])] * result.modified_count
+        else:
+            # Only legacy appointments with some other type need a read for it
+            query = {**query, "status": target, "updated_at": updated_at}
+            async for appointment in db.appointments.find(query, {"_id": 0, "appointment_type": 1}):
+                events.append((current_user["id"], appointment.get("appointment_type"), ROLLUP_EVENTS[target]))
+    await record_appointment_events(events)
+
+    return {"updated": modified, "results": list(results.values())}
+
+# Calendar Feed
+ICS_STATUS = {
+    AppointmentStatus.PENDING: "TENTATIVE",
+    AppointmentStatus.CONFIRMED: "CONFIRMED",
+    AppointmentStatus.COMPLETED: "CONFIRMED",
+    AppointmentStatus.CANCELLED: "CANCELLED",
+}
+
+def ics_escape(value: str) -> str:
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+def ics_line(name: str, value: str) -> str:
+    """Build a content line folded at 75 octets as RFC 5545 requires"""
+    data = f"{name}:{value}".encode("utf-8")
+    chunks = []
+    while len(data) > 75:
+        cut = 75 if not chunks else 74
+        # Never split inside a multi-byte UTF-8 sequence
+        while cut > 0 and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        chunks.append(data[:cut])
+        data = data[cut:]
+    chunks.append(data)
+    return "\r\n ".join(chunk.decode("utf-8") for chunk in chunks) + "\r\n"
+
+def ics_datetime(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+def appointment_to_ics(appointment: dict) -> str:
+    starts_at = appointment["starts_at"]
+    kind = "Tư vấn online" if appointment.get("appointment_type") == AppointmentType.ONLINE else "Khám trực tiếp"
+    changed = appointment.get("updated_at") or appointment.get("created_at")
+    stamp = datetime.fromisoformat(changed) if changed else datetime.now(timezone.utc)
+
+    lines = [
+        "BEGIN:VEVENT\r\n",
+        ics_line("UID", f"{appointment['id']}@medischedule"),
+        ics_line("DTSTAMP", ics_datetime(stamp)),
+        ics_line("DTSTART", ics_datetime(starts_at)),
+        ics_line("DTEND", ics_datetime(starts_at + timedelta(minutes=APPOINTMENT_DURATION_MINUTES))),
+        ics_line("SUMMARY", ics_escape(f"{appointment.get('patient_name') or 'Bệnh nhân'} - {kind}")),
+        ics_line("STATUS", ICS_STATUS.get(appointment.get("status"), "TENTATIVE")),
+    ]
+    if appointment.get("symptoms"):
+        lines.append(ics_line("DESCRIPTION", ics_escape(appointment["symptoms"])))
+    lines.append("END:VEVENT\r\n")
+    return "".join(lines)
+
+async def move_calendar_tokens():
+    """Move feed tokens once stored on doctor_profiles into calendar_feeds"""
+    async for profile in db.doctor_profiles.find({"calendar_token": {"$exists": True}}, {"_id": 0, "user_id": 1, "calendar_token": 1}):
+        await db.calendar_feeds.update_one(
+            {"doctor_id": profile["user_id"]},
+            {"$setOnInsert": {"token": profile["calendar_token"], "created_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+    await db.doctor_profiles.update_many({"calendar_token": {"$exists": True}}, {"$unset": {"calendar_token": ""}})
+
+@api_router.post("/doctors/calendar-feed")
+async def create_calendar_feed(current_user: dict = Depends(require(role=[UserRole.DOCTOR, UserRole.DEPARTMENT_HEAD]))):
+    """Create or rotate the secret URL of the doctor's calendar feed"""
+    # Kept out of doctor_profiles so no profile read can ever return the token
+    doctor = await db.doctor_profiles.find_one({"user_id": current_user["id"]}, {"_id": 0, "user_id": 1})
+    if doctor is None:
+        raise HTTPException(status_code=404, detail="Doctor not found")
     
-    if appointment["doctor_id"] != current_user["id"]:
-        raise HTTPException(status_code=403, detail="Not your appointment")
+    feed_token = secrets.token_urlsafe(32)
+    await db.calendar_feeds.update_one(
+        {"doctor_id": current_user["id"]},
+        {"$set": {"token": feed_token, "created_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    return {"url": f"{API_PREFIX}/calendar/{feed_token}.ics"}
+
+@api_router.get("/calendar/{feed_token}.ics")
+async def get_calendar_feed(
+    feed_token: str,
+    request: Request,
+    days_back: int = Query(30, ge=0, le=365),
+    days_ahead: int = Query(90, ge=1, le=365)
+):
+    """iCalendar feed of a doctor's appointments for calendar clients"""
+    feed = await db.calendar_feeds.find_one({"token": feed_token}, {"_id": 0, "doctor_id": 1})
+    if not feed:
+        raise HTTPException(status_code=404, detail="Calendar not found")
+    doctor_id = feed["doctor_id"]
+    
+    today = datetime.now(APPOINTMENT_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+    query = {
+        "doctor_id": doctor_id,
+        "starts_at": {"$gte": today - timedelta(days=days_back), "$lt": today + timedelta(days=days_ahead)}
+    }
     
-    await db.appointments.update_one(
-        {"id": appointment_id},
-        {"$set": {"status": status_data.status}}
+    # Polling clients usually get a 304 from two index-only lookups
+    latest = await db.appointments.find_one(
+        {"doctor_id": doctor_id},
+        {"_id": 0, "updated_at": 1},
+        sort=[("updated_at", -1)]
     )
+    in_range = await db.appointments.count_documents(query)
+    version = f"{today.date()}|{days_back}|{days_ahead}|{(latest or {}).get('updated_at')}|{in_range}"
+    etag = f'"{hashlib.sha1(version.encode()).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
     
-    updated = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
-    return updated
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    projection = {
+        "_id": 0, "id": 1, "patient_name": 1, "appointment_type": 1, "symptoms": 1,
+        "status": 1, "starts_at": 1, "created_at": 1, "updated_at": 1
+    }
+    
+    async def generate():
+        yield ("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//MediSchedule//Appointments//VI\r\n"
+               "CALSCALE:GREGORIAN\r\nX-WR-CALNAME:MediSchedule\r\n")
+        async for appointment in db.appointments.find(query, projection).sort("starts_at", 1):
+            yield appointment_to_ics(appointment)
+        yield "END:VCALENDAR\r\n"
+    
+    return StreamingResponse(generate(), media_type="text/calendar; charset=utf-8", headers=headers)
 
 # Chat Routes
 @api_router.post("/chat/send")
@@ -785,7 +1915,7 @@ async def send_message(message_data: ChatMessageCreate, current_user: dict = Dep
     return message
 
 @api_router.get("/chat/{appointment_id}")
-async def get_chat_messages(appointment_id: str, current_user: dict = Depends(get_current_user)):
+async def get_chat_messages(appointment_id: str, current_user: dict = Depends(get_current_user_claims)):
     # Verify appointment exists and user is part of it
     appointment = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
     if not appointment:
@@ -799,59 +1929,244 @@ async def get_chat_messages(appointment_id: str, current_user: dict = Depends(ge
     # Sort by created_at
     messages.sort(key=lambda x: x.get("created_at", ""))
     
-    return messages
+    return CompactJSONResponse(messages)
 
 # Admin Routes
 @api_router.get("/admin/doctors")
-async def admin_get_doctors(current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    doctors = await db.doctor_profiles.find({}, {"_id": 0}).to_list(1000)
-    
-    # Get user info for each doctor
-    for doctor in doctors:
-        user = await db.users.find_one({"id": doctor["user_id"]}, {"_id": 0, "password": 0})
-        if user:
-            doctor["full_name"] = user["full_name"]
-            doctor["email"] = user["email"]
-        
-        # Get specialty name
-        if doctor.get("specialty_id"):
-            specialty = await db.specialties.find_one({"id": doctor["specialty_id"]}, {"_id": 0})
-            if specialty:
-                doctor["specialty_name"] = specialty["name"]
+async def admin_get_doctors(fields: Optional[str] = None, current_user: dict = Depends(require(role=UserRole.ADMIN))):
+    requested = parse_fields(fields, DOCTOR_FIELDS)
+    doctors = await db.doctor_profiles.find({}, sparse_projection(requested, DOCTOR_PROFILE_PROJECTION, DOCTOR_FIELD_SOURCES, ("user_id",))).to_list(1000)
     
-    return doctors
+    await attach_doctor_details(doctors, requested)
+    trim_fields(doctors, requested, ("user_id",))
+    return CompactJSONResponse(doctors)
 
 @api_router.put("/admin/doctors/{doctor_id}/approve")
-async def admin_approve_doctor(doctor_id: str, status: str, current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    await db.doctor_profiles.update_one(
+async def admin_approve_doctor(doctor_id: str, status: str, current_user: dict = Depends(require(role=UserRole.ADMIN))):
+    doctor = await update_and_fetch(
+        db.doctor_profiles,
         {"user_id": doctor_id},
-        {"$set": {"status": status}}
+        {"$set": {"status": status}},
+        DOCTOR_PROFILE_PROJECTION
     )
-    
-    doctor = await db.doctor_profiles.find_one({"user_id": doctor_id}, {"_id": 0})
     return doctor
 
 @api_router.get("/admin/patients")
-async def admin_get_patients(current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    patients = await db.users.find({"role": UserRole.PATIENT}, {"_id": 0, "password": 0}).to_list(1000)
-    return patients
+async def admin_get_patients(
+    q: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(PATIENT_PAGE_SIZE, ge=1, le=200),
+    fields: Optional[str] = None,
+    current_user: dict = Depends(require(role=UserRole.ADMIN))
+):
+    """Search patients by name, email or phone prefix, optionally within a registration date range"""
+    return await list_patients(q, created_from, created_to, cursor, limit, fields)
+
+# Admin - Appointment Analytics
+ANALYTICS_RANGE_DEFAULT_DAYS = 30
+ANALYTICS_RANGE_MAX_DAYS = 731
+
+@api_router.get("/admin/analytics/appointments")
+async def admin_appointment_analytics(
+    date_from: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    date_to: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    specialty_id: Optional[str] = None,
+    doctor_id: Optional[str] = None,
+    appointment_type: Optional[str] = Query(None, pattern="^(in_person|online)$"),
+    current_user: dict = Depends(require(role=UserRole.ADMIN))
+):
+    """Daily created/completed/cancelled counts, summed from the appointment rollups"""
+    today = datetime.now(APPOINTMENT_TIMEZONE).date()
+    date_to = date_to or today.isoformat()
+    date_from = date_from or (today - timedelta(days=ANALYTICS_RANGE_DEFAULT_DAYS - 1)).isoformat()
+    try:
+        first_day = datetime.strptime(date_from, "%Y-%m-%d")
+        days = (datetime.strptime(date_to, "%Y-%m-%d") - first_day).days + 1
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date")
+    if not 1 <= days <= ANALYTICS_RANGE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"date_to must be on or after date_from and at most {ANALYTICS_RANGE_MAX_DAYS} days later")
+    
+    match = {"day": {"$gte": date_from, "$lte": date_to}}
+    if specialty_id:
+        match["specialty_id"] = specialty_id
+    if doctor_id:
+        match["doctor_id"] = doctor_id
+    if appointment_type:
+        match["appointment_type"] = appointment_type
+    sums = {counter: {"$sum": f"${counter}"} for counter in ROLLUP_COUNTERS}
+    result = (await db.appointment_rollups.aggregate([
+        {"$match": match},
+        {"$facet": {
+            "daily": [{"$group": {"_id": "$day", **sums}}],
+            "by_specialty": [{"$group": {"_id": "$specialty_id", **sums}}],
+            "by_type": [{"$group": {"_id": "$appointment_type", **sums}}]
+        }}
+    ]).to_list(1))[0]
+    
+    def counts(group: dict) -> dict:
+        return {counter: group.get(counter, 0) for counter in ROLLUP_COUNTERS}
+    
+    # Days without any rollup still get a point, so charts have no gaps
+    daily = {group["_id"]: counts(group) for group in result["daily"]}
+    series = []
+    for i in range(days):
+        day = (first_day + timedelta(days=i)).strftime("%Y-%m-%d")
+        series.append({"day": day, **daily.get(day, counts({}))})
+    
+    names = {
+        specialty["id"]: specialty["name"]
+        async for specialty in db.specialties.find({"id": {"$in": [group["_id"] for group in result["by_specialty"]]}}, {"_id": 0, "id": 1, "name": 1})
+    }
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "totals": {counter: sum(point[counter] for point in series) for counter in ROLLUP_COUNTERS},
+        "daily": series,
+        "by_specialty": sorted(
+            [{"specialty_id": group["_id"], "specialty_name": names.get(group["_id"]), **counts(group)} for group in result["by_specialty"]],
+            key=lambda group: group["created"],
+            reverse=True
+        ),
+        "by_type": {group["_id"]: counts(group) for group in result["by_type"]}
+    }
+
+# Admin - Streaming Exports
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+EXPORTS = {
+    "patients": {
+        "permission": "can_manage_patients",
+        "fields": ["id", "email", "username", "full_name", "phone", "date_of_birth", "address", "created_at"],
+    },
+    "doctors": {
+        "permission": "can_manage_doctors",
+        "fields": [
+            "user_id", "full_name", "email", "phone", "specialty_id", "specialty_name", "experience_years",
+            "consultation_fee", "status", "is_department_head", "created_at"
+        ],
+    },
+    "appointments": {
+        "permission": "can_manage_appointments",
+        "fields": [
+            "id", "patient_id", "patient_name", "doctor_id", "doctor_name", "appointment_type",
+            "appointment_date", "appointment_time", "status", "symptoms", "created_at"
+        ],
+    },
+}
+
+async def export_cursor(collection: str, date_from: Optional[str], date_to: Optional[str]):
+    fields = EXPORTS[collection]["fields"]
+    projection = {"_id": 0, **{field: 1 for field in fields}}
+    
+    if collection == "patients":
+        # Walks the (role, created_at, id) index instead of sorting in memory
+        return db.users.find({"role": UserRole.PATIENT, "deleted_at": None}, projection).sort([("created_at", 1), ("id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+    
+    if collection == "doctors":
+        # Joined server-side so the export stays a single cursor
+        return db.doctor_profiles.aggregate([
+            {"$sort": {"_id": 1}},
+            {"$lookup": {"from": "users", "localField": "user_id", "foreignField": "id", "as": "user"}},
+            {"$lookup": {"from": "specialties", "localField": "specialty_id", "foreignField": "id", "as": "specialty"}},
+            {"$addFields": {
+                "full_name": {"$arrayElemAt": ["$user.full_name", 0]},
+                "email": {"$arrayElemAt": ["$user.email", 0]},
+                "phone": {"$arrayElemAt": ["$user.phone", 0]},
+                "specialty_name": {"$arrayElemAt": ["$specialty.name", 0]}
+            }},
+            {"$project": projection}
+        ], batchSize=EXPORT_BATCH_SIZE)
+    
+    # Like the users export, leave out accounts awaiting the purge worker.
+    # Only those still have appointments, so this list stays short
+    deleted = await db.users.distinct("id", {"deleted_at": {"$exists": True}})
+    query = {"patient_id": {"$nin": deleted}, "doctor_id": {"$nin": deleted}} if deleted else {}
+    if date_from or date_to:
+        query["appointment_date"] = {}
+        if date_from:
+            query["appointment_date"]["$gte"] = date_from
+        if date_to:
+            query["appointment_date"]["$lte"] = date_to
+    # The appointment_date index serves both the range and the order
+    return db.appointments.find(query, projection).sort("appointment_date", 1).batch_size(EXPORT_BATCH_SIZE)
+
+def export_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+async def export_chunks(cursor, fields: List[str], file_format: str, compress: bool):
+    """Serialize a cursor to CSV/NDJSON in ~64 KB pieces, gzipped on the fly"""
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if file_format == "csv" else None
+    if writer:
+        # BOM so Excel opens the Vietnamese names as UTF-8
+        buffer.write("\ufeff")
+        writer.writerow(fields)
+    
+    def take() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+    
+    async for document in cursor:
+        if writer:
+            writer.writerow([export_value(document.get(field)) for field in fields])
+        else:
+            buffer.write(json.dumps({field: document.get(field) for field in fields}, ensure_ascii=False, default=str) + "\n")
+        if buffer.tell() >= EXPORT_FLUSH_BYTES:
+            chunk = take()
+            if chunk:
+                yield chunk
+    
+    chunk = take()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+@api_router.get("/admin/export/{collection}")
+async def admin_export(
+    collection: str,
+    request: Request,
+    file_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    current_user: dict = Depends(require(role=UserRole.ADMIN))
+):
+    """Stream patients, doctors or appointments straight from a cursor as CSV or NDJSON"""
+    export = EXPORTS.get(collection)
+    if export is None:
+        raise HTTPException(status_code=404, detail=f"Unknown export. Choose one of: {', '.join(EXPORTS)}")
+    if not current_user["permission_bits"] & PERMISSION_BITS[export["permission"]]:
+        raise HTTPException(status_code=403, detail=f"You don't have permission to {PERMISSION_DESCRIPTIONS[export['permission']]}")
+    
+    compress = "gzip" in request.headers.get("accept-encoding", "")
+    filename = f"{collection}-{datetime.now(timezone.utc).strftime('%Y%m%d')}.{file_format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Vary": "Accept-Encoding"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    
+    return StreamingResponse(
+        export_chunks(await export_cursor(collection, date_from, date_to), export["fields"], file_format, compress),
+        media_type="text/csv; charset=utf-8" if file_format == "csv" else "application/x-ndjson",
+        headers=headers
+    )
 
 @api_router.get("/admin/stats")
-async def admin_get_stats(current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    total_patients = await db.users.count_documents({"role": UserRole.PATIENT})
-    total_doctors = await db.users.count_documents({"role": UserRole.DOCTOR})
+async def admin_get_stats(current_user: dict = Depends(require(role=UserRole.ADMIN))):
+    total_patients = await db.users.count_documents({"role": UserRole.PATIENT, "deleted_at": None})
+    total_doctors = await db.users.count_documents({"role": UserRole.DOCTOR, "deleted_at": None})
     total_appointments = await db.appointments.count_documents({})
     
     pending_appointments = await db.appointments.count_documents({"status": AppointmentStatus.PENDING})
@@ -881,15 +2196,7 @@ async def admin_get_stats(current_user: dict = Depends(get_current_user)):
 
 # Admin - Create Admin Account with Permissions
 @api_router.post("/admin/create-admin")
-async def create_admin_account(user_data: UserCreate, current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    # Check if current admin has permission to create admins
-    current_permissions = current_user.get("admin_permissions") or {}
-    if not current_permissions.get("can_create_admins", False):
-        raise HTTPException(status_code=403, detail="You don't have permission to create admin accounts")
-    
+async def create_admin_account(user_data: UserCreate, current_user: dict = Depends(require(role=UserRole.ADMIN, perm="can_create_admins"))):
     # Force role to be admin
     user_data.role = UserRole.ADMIN
     
@@ -899,7 +2206,7 @@ async def create_admin_account(user_data: UserCreate, current_user: dict = Depen
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash password
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await asyncio.to_thread(hash_password, user_data.password)
     
     # Set default permissions if not provided
     if not user_data.admin_permissions:
@@ -923,6 +2230,8 @@ async def create_admin_account(user_data: UserCreate, current_user: dict = Depen
     user_dict = user.model_dump()
     user_dict["password"] = hashed_password
     user_dict["created_at"] = user_dict["created_at"].isoformat()
+    user_dict["login_keys"] = login_keys_for(user.email, user.username)
+    user_dict["search_terms"] = user_search_terms(user.full_name, user.email, user.phone)
     
     await db.users.insert_one(user_dict)
     
@@ -933,96 +2242,74 @@ async def create_admin_account(user_data: UserCreate, current_user: dict = Depen
 
 # Admin - Get All Admins
 @api_router.get("/admin/admins")
-async def get_all_admins(current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    admins = await db.users.find({"role": UserRole.ADMIN}, {"_id": 0, "password": 0}).to_list(1000)
+async def get_all_admins(current_user: dict = Depends(require(role=UserRole.ADMIN))):
+    admins = await db.users.find({"role": UserRole.ADMIN, "deleted_at": None}, USER_LIST_PROJECTION).to_list(1000)
     return admins
 
+# Admin - Route Permission Audit
+@api_router.get("/admin/route-permissions")
+async def get_route_permissions(current_user: dict = Depends(require(role=UserRole.ADMIN))):
+    """Roles and permissions required by every route, built at startup"""
+    return route_permission_table
+
 # Admin - Update Admin Permissions
 class UpdatePermissionsRequest(BaseModel):
     admin_id: str
     permissions: dict
 
 @api_router.put("/admin/update-permissions")
-async def update_admin_permissions(request: UpdatePermissionsRequest, current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    # Check if current admin has permission to create admins (implies managing admins)
-    current_permissions = current_user.get("admin_permissions") or {}
-    if not current_permissions.get("can_create_admins", False):
-        raise HTTPException(status_code=403, detail="You don't have permission to manage admin accounts")
-    
+async def update_admin_permissions(request: UpdatePermissionsRequest, current_user: dict = Depends(require(role=UserRole.ADMIN, perm="can_create_admins"))):
     # Prevent admin from modifying their own permissions
     if request.admin_id == current_user["id"]:
         raise HTTPException(status_code=400, detail="Cannot modify your own permissions")
     
     # Update permissions
-    result = await db.users.update_one(
+    updated_admin = await update_and_fetch(
+        db.users,
         {"id": request.admin_id, "role": UserRole.ADMIN},
-        {"$set": {"admin_permissions": request.permissions}}
+        {"$set": {"admin_permissions": request.permissions}},
+        {"_id": 0, "password": 0}
     )
     
-    if result.matched_count == 0:
+    if updated_admin is None:
         raise HTTPException(status_code=404, detail="Admin not found")
     
-    updated_admin = await db.users.find_one({"id": request.admin_id}, {"_id": 0, "password": 0})
+    # Permissions are embedded in the admin's tokens
+    await revoke_user_tokens(request.admin_id)
+    
     return {"message": "Permissions updated successfully", "admin": updated_admin}
 
 # Admin - Delete Admin Account
 @api_router.delete("/admin/delete-admin/{admin_id}")
-async def delete_admin_account(admin_id: str, current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    # Check permission
-    current_permissions = current_user.get("admin_permissions") or {}
-    if not current_permissions.get("can_create_admins", False):
-        raise HTTPException(status_code=403, detail="You don't have permission to delete admin accounts")
-    
+async def delete_admin_account(admin_id: str, current_user: dict = Depends(require(role=UserRole.ADMIN, perm="can_create_admins"))):
     # Prevent self-deletion
     if admin_id == current_user["id"]:
         raise HTTPException(status_code=400, detail="Cannot delete your own account")
     
     # Check if target is admin
-    target_admin = await db.users.find_one({"id": admin_id, "role": UserRole.ADMIN})
+    target_admin = await db.users.find_one({"id": admin_id, "role": UserRole.ADMIN, "deleted_at": None})
     if not target_admin:
         raise HTTPException(status_code=404, detail="Admin not found")
     
     # Delete
-    await db.users.delete_one({"id": admin_id})
+    await cascade_delete_user(admin_id)
     
     return {"message": "Admin account deleted successfully"}
 
 # Admin - Delete Any User Account (Patient, Doctor, Department Head)
 @api_router.delete("/admin/delete-user/{user_id}")
-async def admin_delete_user(user_id: str, current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
+async def admin_delete_user(user_id: str, current_user: dict = Depends(require(role=UserRole.ADMIN))):
     # Prevent self-deletion
     if user_id == current_user["id"]:
         raise HTTPException(status_code=400, detail="Cannot delete your own account")
     
     # Get user info
-    user = await db.users.find_one({"id": user_id})
+    user = await db.users.find_one({"id": user_id, "deleted_at": None}, {"_id": 0, "role": 1})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # If doctor, also delete doctor profile
-    if user["role"] == UserRole.DOCTOR:
-        await db.doctor_profiles.delete_one({"user_id": user_id})
-        # Also delete related appointments if needed
-        await db.appointments.delete_many({"doctor_id": user_id})
-    
-    # If patient, delete related appointments
-    if user["role"] == UserRole.PATIENT:
-        await db.appointments.delete_many({"patient_id": user_id})
-    
-    # Delete user
-    await db.users.delete_one({"id": user_id})
+    # Profile, appointments, chats, AI history and tokens go with the account
+    await cascade_delete_user(user_id)
     
     return {"message": f"{user['role'].capitalize()} account deleted successfully"}
 
@@ -1051,10 +2338,7 @@ class CreateUserAccountRequest(BaseModel):
         return v.lower()
 
 @api_router.post("/admin/create-user")
-async def admin_create_user(user_data: CreateUserAccountRequest, current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
+async def admin_create_user(user_data: CreateUserAccountRequest, current_user: dict = Depends(require(role=UserRole.ADMIN))):
     # Validate role
     if not UserRole.is_valid(user_data.role):
         raise HTTPException(status_code=400, detail="Invalid role")
@@ -1065,7 +2349,7 @@ async def admin_create_user(user_data: CreateUserAccountRequest, current_user: d
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash password
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await asyncio.to_thread(hash_password, user_data.password)
     
     # Create user
     user = User(
@@ -1078,6 +2362,8 @@ async def admin_create_user(user_data: CreateUserAccountRequest, current_user: d
     user_dict = user.model_dump()
     user_dict["password"] = hashed_password
     user_dict["created_at"] = user_dict["created_at"].isoformat()
+    user_dict["login_keys"] = login_keys_for(user.email, user.username)
+    user_dict["search_terms"] = user_search_terms(user.full_name, user.email, user_data.phone)
     
     # Add optional fields
     if user_data.phone:
@@ -1114,12 +2400,252 @@ async def admin_create_user(user_data: CreateUserAccountRequest, current_user: d
             "created_at": datetime.now(timezone.utc).isoformat()
         }
         await db.doctor_profiles.insert_one(doctor_profile)
+        await refresh_doctor_search({"user_id": doctor_profile["user_id"]})
     
     # Remove MongoDB _id before returning
     user_dict.pop("_id", None)
     user_dict.pop("password")
     return {"message": f"{user_data.role.capitalize()} account created successfully", "user": user_dict}
 
+# Admin - Bulk User Import
+IMPORT_MAX_BYTES = int(os.environ.get("IMPORT_MAX_BYTES", 10 * 1024 * 1024))
+IMPORT_CHUNK_SIZE = 200
+IMPORT_HASH_WORKERS = int(os.environ.get("IMPORT_HASH_WORKERS", os.cpu_count() or 2))
+IMPORT_ROLES = {UserRole.PATIENT, UserRole.DOCTOR, UserRole.DEPARTMENT_HEAD}
+DEFAULT_DEPARTMENT_HEAD_PERMISSIONS = {
+    "can_manage_doctors": True,
+    "can_manage_patients": True,
+    "can_manage_appointments": True,
+    "can_view_stats": True,
+    "can_manage_specialties": False,
+    "can_create_admins": False
+}
+
+import_hash_pool: Optional[ProcessPoolExecutor] = None
+
+def hash_passwords(passwords: List[str], rounds: int) -> List[str]:
+    """Runs in the import process pool, so a large import can't take over the default thread pool that login hashing uses"""
+    hasher = bcrypt_hasher.using(rounds=rounds)
+    return [hasher.hash(password) for password in passwords]
+
+async def hash_passwords_in_pool(passwords: List[str]) -> List[str]:
+    global import_hash_pool
+    if import_hash_pool is None:
+        # Forking a process that runs threads and an event loop can copy held locks
+        import_hash_pool = ProcessPoolExecutor(max_workers=IMPORT_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    rounds = pwd_context.handler("bcrypt").default_rounds
+    loop = asyncio.get_running_loop()
+    per_worker = max(1, math.ceil(len(passwords) / IMPORT_HASH_WORKERS))
+    batches = [passwords[i:i + per_worker] for i in range(0, len(passwords), per_worker)]
+    results = await asyncio.gather(*[
+        loop.run_in_executor(import_hash_pool, hash_passwords, batch, rounds) for batch in batches
+    ])
+    return [hashed for batch in results for hashed in batch]
+
+class ImportUserRow(CreateUserAccountRequest):
+    username: Optional[str] = None
+    
+    @field_validator('username')
+    @classmethod
+    def validate_username(cls, v):
+        return UserCreate.validate_username(v) if v is not None else None
+    
+    @field_validator('password')
+    @classmethod
+    def validate_password(cls, v):
+        return PasswordChangeRequest.validate_password(v)
+    
+    @field_validator('phone')
+    @classmethod
+    def validate_phone(cls, v):
+        return UserCreate.validate_phone(v) if v is not None else None
+    
+    @field_validator('role')
+    @classmethod
+    def validate_role(cls, v):
+        if v not in IMPORT_ROLES:
+            raise ValueError('Role must be patient, doctor or department_head')
+        return v
+    
+    @field_validator('admin_permissions', mode='before')
+    @classmethod
+    def parse_admin_permissions(cls, v):
+        # CSV cells carry the permissions as a JSON object
+        return json.loads(v) if isinstance(v, str) else v
+
+def parse_import_rows(body: bytes, file_format: str):
+    """Yield (row number, raw dict or parse error) from a CSV or JSONL upload"""
+    text = body.decode("utf-8-sig")
+    if file_format == "csv":
+        for number, row in enumerate(csv.DictReader(io.StringIO(text)), start=1):
+            yield number, {k.strip(): v.strip() for k, v in row.items() if k and isinstance(v, str) and v.strip()}
+        return
+    
+    number = 0
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+            yield number, row if isinstance(row, dict) else ValueError("Row must be a JSON object")
+        except ValueError as e:
+            yield number, e
+
+def import_row_errors(error: Exception) -> List[str]:
+    if hasattr(error, "errors"):
+        return [f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors()]
+    return [str(error)]
+
+async def import_user_chunk(rows: List[tuple]) -> List[dict]:
+    """Validate, hash and insert one chunk of rows; returns their report lines"""
+    report = {}
+    valid = []
+    for number, raw in rows:
+        if isinstance(raw, Exception):
+            report[number] = {"row": number, "status": "error", "errors": import_row_errors(raw)}
+            continue
+        try:
+            row = ImportUserRow(**raw)
+        except Exception as e:
+            report[number] = {"row": number, "status": "error", "email": raw.get("email"), "errors": import_row_errors(e)}
+            continue
+        if row.username is None:
+            try:
+                # Same rules as registration, e.g. "ab@x.com" gives a too-short username
+                row.username = UserCreate.validate_username(re.sub(r'[^a-z0-9_]', '_', row.email.split('@')[0]))
+            except ValueError as e:
+                report[number] = {"row": number, "status": "error", "email": row.email, "errors": [f"username: {e}"]}
+                continue
+        valid.append((number, row))
+    
+    # One query each for existing accounts and referenced specialties
+    keys = [key for _, row in valid for key in login_keys_for(row.email, row.username)]
+    existing_keys = set()
+    async for user in db.users.find({"login_keys": {"$in": keys}}, {"_id": 0, "login_keys": 1}):
+        existing_keys.update(user["login_keys"])
+    specialty_ids = {row.specialty_id for _, row in valid if row.specialty_id}
+    known_specialties = {
+        s["id"] for s in await db.specialties.find({"id": {"$in": list(specialty_ids)}}, {"_id": 0, "id": 1}).to_list(len(specialty_ids))
+    }
+    
+    accepted = []
+    for number, row in valid:
+        keys = login_keys_for(row.email, row.username)
+        if existing_keys.intersection(keys):
+            report[number] = {"row": number, "status": "duplicate", "email": row.email, "errors": ["Email or username already registered"]}
+        elif row.specialty_id and row.specialty_id not in known_specialties:
+            report[number] = {"row": number, "status": "error", "email": row.email, "errors": ["specialty_id: Specialty not found"]}
+        else:
+            # Also catches duplicates within the same upload
+            existing_keys.update(keys)
+            accepted.append((number, row))
+    
+    hashed_passwords = await hash_passwords_in_pool([row.password for _, row in accepted])
+    
+    user_docs = []
+    for (number, row), hashed_password in zip(accepted, hashed_passwords):
+        user_dict = User(
+            email=row.email,
+            username=row.username,
+            full_name=row.full_name,
+            phone=row.phone,
+            date_of_birth=row.date_of_birth,
+            address=row.address,
+            role=row.role,
+            admin_permissions=(row.admin_permissions or DEFAULT_DEPARTMENT_HEAD_PERMISSIONS) if row.role == UserRole.DEPARTMENT_HEAD else None
+        ).model_dump()
+        user_dict["password"] = hashed_password
+        user_dict["created_at"] = user_dict["created_at"].isoformat()
+        user_dict["login_keys"] = login_keys_for(row.email, row.username)
+        user_dict["search_terms"] = user_search_terms(row.full_name, row.email, row.phone)
+        user_docs.append(user_dict)
+    
+    failed = {}
+    if user_docs:
+        try:
+            await db.users.insert_many(user_docs, ordered=False)
+        except BulkWriteError as e:
+            # Accounts registered since the existence check above
+            failed = {error["index"]: error for error in e.details["writeErrors"]}
+    
+    doctor_profiles = []
+    for index, ((number, row), user_dict) in enumerate(zip(accepted, user_docs)):
+        if index in failed:
+            error = failed[index]
+            status_name = "duplicate" if error.get("code") == 11000 else "error"
+            report[number] = {"row": number, "status": status_name, "email": row.email, "errors": [error.get("errmsg", "Write failed")]}
+            continue
+        report[number] = {"row": number, "status": "created", "email": row.email, "id": user_dict["id"], "username": row.username}
+        if row.role == UserRole.DOCTOR and row.specialty_id:
+            doctor_profiles.append({
+                "id": str(uuid.uuid4()),
+                "user_id": user_dict["id"],
+                "specialty_id": row.specialty_id,
+                "bio": row.bio or "",
+                "experience_years": row.experience_years or 0,
+                "consultation_fee": row.consultation_fee or 0,
+                "status": "approved",  # Admin creates approved doctors
+                "created_at": datetime.now(timezone.utc).isoformat()
+            })
+    
+    if doctor_profiles:
+        await db.doctor_profiles.insert_many(doctor_profiles, ordered=False)
+        await refresh_doctor_search({"user_id": {"$in": [profile["user_id"] for profile in doctor_profiles]}})
+    
+    return [report[number] for number, _ in rows]
+
+@api_router.post("/admin/users:import")
+async def admin_import_users(
+    request: Request,
+    file_format: Optional[str] = Query(None, alias="format", pattern="^(csv|jsonl)$"),
+    current_user: dict = Depends(require(role=UserRole.ADMIN))
+):
+    """Create patient/doctor/department head accounts from a CSV or JSONL upload"""
+    body = await request.body()
+    if len(body) > IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Import file exceeds {IMPORT_MAX_BYTES} bytes")
+    if file_format is None:
+        file_format = "csv" if "csv" in request.headers.get("content-type", "") else "jsonl"
+    try:
+        body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Import file must be UTF-8 encoded")
+    
+    async def report_lines():
+        totals = {"created": 0, "duplicate": 0, "error": 0}
+        chunk = []
+        rows = parse_import_rows(body, file_format)
+        while True:
+            row = next(rows, None)
+            if row is not None:
+                chunk.append(row)
+            if chunk and (row is None or len(chunk) >= IMPORT_CHUNK_SIZE):
+                try:
+                    lines = await import_user_chunk(chunk)
+                except Exception as e:
+                    # Keep streaming the rest of the report
+                    logger.error(f"User import chunk failed: {e}")
+                    lines = [
+                        {
+                            "row": number,
+                            "status": "error",
+                            "email": raw.get("email") if isinstance(raw, dict) else None,
+                            "errors": ["Import of this chunk failed; some of its accounts may have been created"]
+                        }
+                        for number, raw in chunk
+                    ]
+                for line in lines:
+                    totals[line["status"]] += 1
+                    yield json.dumps(line, ensure_ascii=False) + "\n"
+                chunk = []
+            if row is None:
+                break
+        logger.info(f"User import by {current_user['id']}: {totals}")
+        yield json.dumps({"summary": totals}) + "\n"
+    
+    return StreamingResponse(report_lines(), media_type="application/x-ndjson")
+
 # Department Head Models
 class PromoteToDepartmentHeadRequest(BaseModel):
     doctor_id: str
@@ -1149,22 +2675,227 @@ async def health_check():
         )
 
 # Department Head Routes
+DEPARTMENT_CACHE_SECONDS = int(os.environ.get("DEPARTMENT_CACHE_SECONDS", "300"))
+
+class DepartmentCache:
+    """Department head user_id -> specialty_id, so scoped routes skip the profile lookup
+
+    Entries expire after ttl_seconds, which bounds how long other workers
+    keep a mapping this process invalidated.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, tuple] = {}
+
+    async def specialty_of(self, user_id: str) -> str:
+        entry = self._entries.get(user_id)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        profile = await db.doctor_profiles.find_one({"user_id": user_id}, {"_id": 0, "specialty_id": 1})
+        if not profile or not profile.get("specialty_id"):
+            raise HTTPException(status_code=404, detail="Department Head profile not found")
+        self._entries[user_id] = (profile["specialty_id"], time.monotonic() + self.ttl_seconds)
+        return profile["specialty_id"]
+
+    def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
+
+department_cache = DepartmentCache(DEPARTMENT_CACHE_SECONDS)
+
+async def require_same_department(current_user: dict, specialty_id: Optional[str], detail: str):
+    """Department heads may only act within their own specialty; admins anywhere"""
+    if current_user["role"] == UserRole.DEPARTMENT_HEAD:
+        if await department_cache.specialty_of(current_user["id"]) != specialty_id:
+            raise HTTPException(status_code=403, detail=detail)
+
+async def department_stats(specialty_id: str) -> dict:
+    """Doctor, appointment and patient counts for one specialty"""
+    profiles = await db.doctor_profiles.find({"specialty_id": specialty_id}, {"_id": 0, "user_id": 1, "status": 1}).to_list(None)
+    doctors = Counter(profile.get("status") for profile in profiles)
+    
+    # Over appointments by the (doctor_id, status) index, so no document ever
+    # holds a department's appointments or patient ids
+    pipeline = [
+        {"$match": {"doctor_id": {"$in": [profile["user_id"] for profile in profiles]}}},
+        {"$facet": {
+            "appointments": [{"$group": {
+                "_id": None,
+                "total": {"$sum": 1},
+                "completed": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, 1, 0]}}
+            }}],
+            "patients": [{"$group": {"_id": "$patient_id"}}, {"$count": "count"}]
+        }}
+    ]
+    result = (await db.appointments.aggregate(pipeline).to_list(1))[0]
+    appointments = result["appointments"][0] if result["appointments"] else {"total": 0, "completed": 0}
+    appointments["patients"] = result["patients"][0]["count"] if result["patients"] else 0
+    return {
+        "total_doctors": sum(doctors.values()),
+        "approved_doctors": doctors.get("approved", 0),
+        "pending_doctors": doctors.get("pending", 0),
+        "total_patients": appointments["patients"],
+        "total_appointments": appointments["total"],
+        "completed_appointments": appointments["completed"]
+    }
+
+# Department Analytics
+ANALYTICS_CACHE_SECONDS = int(os.environ.get("ANALYTICS_CACHE_SECONDS", "300"))
+ANALYTICS_CACHE_SIZE = int(os.environ.get("ANALYTICS_CACHE_SIZE", "256"))
+ANALYTICS_DEFAULT_DAYS = 28
+ANALYTICS_MAX_DAYS = 366
+WEEK_MS = 7 * 24 * 3600 * 1000
+ANALYTICS_STATUSES = [AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED, AppointmentStatus.COMPLETED, AppointmentStatus.CANCELLED]
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+class DepartmentAnalyticsCache:
+    """Bounded LRU of analytics results per department and date range
+
+    A department's results are dropped when one of its doctors' appointments
+    is written by this process; ttl_seconds bounds staleness from writes
+    made by other workers.
+    """
+
+    def __init__(self, ttl_seconds: int, max_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._results: OrderedDict = OrderedDict()
+        self._doctor_departments: Dict[str, str] = {}
+
+    def get(self, specialty_id: str, key: tuple) -> Optional[dict]:
+        entry = self._results.get((specialty_id, key))
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._results[(specialty_id, key)]
+            return None
+        self._results.move_to_end((specialty_id, key))
+        return entry[0]
+
+    def put(self, specialty_id: str, key: tuple, doctor_ids: List[str], result: dict):
+        if self.max_size <= 0:
+            return
+        for doctor_id in doctor_ids:
+            self._doctor_departments[doctor_id] = specialty_id
+        now = time.monotonic()
+        for expired in [cached for cached, entry in self._results.items() if entry[1] <= now]:
+            del self._results[expired]
+        self._results[(specialty_id, key)] = (result, now + self.ttl_seconds)
+        self._results.move_to_end((specialty_id, key))
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+    def invalidate_doctor(self, doctor_id: str):
+        specialty_id = self._doctor_departments.get(doctor_id)
+        if specialty_id:
+            for cached in [cached for cached in self._results if cached[0] == specialty_id]:
+                del self._results[cached]
+
+    def clear(self):
+        self._results.clear()
+
+department_analytics_cache = DepartmentAnalyticsCache(ANALYTICS_CACHE_SECONDS, ANALYTICS_CACHE_SIZE)
+
+def slot_minutes(slot: dict) -> int:
+    try:
+        start = datetime.strptime(slot["start_time"], "%H:%M")
+        end = datetime.strptime(slot["end_time"], "%H:%M")
+    except (KeyError, TypeError, ValueError):
+        return 0
+    return max(int((end - start).total_seconds() // 60), 0)
+
+def available_minutes(available_slots: List[dict], first_day: datetime, days: int) -> int:
+    """Minutes of working time available_slots offers over days days starting at first_day"""
+    per_weekday = dict.fromkeys(WEEKDAYS, 0)
+    for slot in available_slots or []:
+        if slot.get("day") in per_weekday:
+            per_weekday[slot["day"]] += slot_minutes(slot)
+    return sum(per_weekday[WEEKDAYS[(first_day + timedelta(days=i)).weekday()]] for i in range(days))
+
+async def department_analytics(specialty_id: str, date_from: str, date_to: str) -> dict:
+    """Per-doctor appointment counts by status, weekly trend and slot utilization"""
+    first_day = datetime.strptime(date_from, "%Y-%m-%d")
+    days = (datetime.strptime(date_to, "%Y-%m-%d") - first_day).days + 1
+    start = appointment_starts_at(date_from, "00:00")
+    end = start + timedelta(days=days)
+    weeks = math.ceil(days / 7)
+    # Weeks that are 7 days long and already over; only these are compared
+    elapsed_days = (datetime.now(APPOINTMENT_TIMEZONE).date() - first_day.date()).days
+    complete_weeks = max(min(days, elapsed_days) // 7, 0)
+    
+    doctors = await db.doctor_profiles.find(
+        {"specialty_id": specialty_id},
+        {"_id": 0, "user_id": 1, "status": 1, "available_slots": 1}
+    ).to_list(1000)
+    doctor_ids = [doctor["user_id"] for doctor in doctors]
+    names = {
+        user["id"]: user["full_name"]
+        async for user in db.users.find({"id": {"$in": doctor_ids}}, {"_id": 0, "id": 1, "full_name": 1})
+    }
+    
+    # Served by the (doctor_id, starts_at) index
+    groups = await db.appointments.aggregate([
+        {"$match": {"doctor_id": {"$in": doctor_ids}, "starts_at": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {
+                "doctor_id": "$doctor_id",
+                "status": "$status",
+                "week": {"$floor": {"$divide": [{"$subtract": ["$starts_at", start]}, WEEK_MS]}}
+            },
+            "count": {"$sum": 1}
+        }}
+    ]).to_list(None)
+    
+    stats = {
+        doctor_id: {"by_status": dict.fromkeys(ANALYTICS_STATUSES, 0), "weekly": [0] * weeks}
+        for doctor_id in doctor_ids
+    }
+    for group in groups:
+        doctor = stats[group["_id"]["doctor_id"]]
+        doctor["by_status"][group["_id"]["status"]] = doctor["by_status"].get(group["_id"]["status"], 0) + group["count"]
+        doctor["weekly"][int(group["_id"]["week"])] += group["count"]
+    
+    results = []
+    for doctor in doctors:
+        doctor_stats = stats[doctor["user_id"]]
+        weekly = doctor_stats["weekly"]
+        last_week, previous_week = (weekly[complete_weeks - 1], weekly[complete_weeks - 2]) if complete_weeks > 1 else (0, 0)
+        booked = (sum(doctor_stats["by_status"].values()) - doctor_stats["by_status"][AppointmentStatus.CANCELLED]) * APPOINTMENT_DURATION_MINUTES
+        available = available_minutes(doctor.get("available_slots"), first_day, days)
+        results.append({
+            "doctor_id": doctor["user_id"],
+            "full_name": names.get(doctor["user_id"]),
+            "status": doctor.get("status"),
+            "total_appointments": sum(doctor_stats["by_status"].values()),
+            "by_status": doctor_stats["by_status"],
+            "weekly": weekly,
+            # Last completed week against the one before; a partial week would always look like a drop
+            "week_over_week": round((last_week - previous_week) / previous_week, 4) if previous_week else None,
+            "booked_minutes": booked,
+            "available_minutes": available,
+            "utilization": round(booked / available, 4) if available else None
+        })
+    results.sort(key=lambda doctor: doctor["total_appointments"], reverse=True)
+    
+    return {
+        "specialty_id": specialty_id,
+        "date_from": date_from,
+        "date_to": date_to,
+        "week_starts": [(first_day + timedelta(weeks=i)).strftime("%Y-%m-%d") for i in range(weeks)],
+        "complete_weeks": complete_weeks,
+        "doctors": results
+    }
+
 @api_router.post("/department-head/promote")
-async def promote_to_department_head(request: PromoteToDepartmentHeadRequest, current_user: dict = Depends(get_current_user)):
+async def promote_to_department_head(request: PromoteToDepartmentHeadRequest, current_user: dict = Depends(require(role=[UserRole.ADMIN, UserRole.DEPARTMENT_HEAD]))):
     """Admin hoặc Trưởng khoa hiện tại có thể chỉ định Trưởng khoa mới"""
-    if current_user["role"] not in [UserRole.ADMIN, UserRole.DEPARTMENT_HEAD]:
-        raise HTTPException(status_code=403, detail="Admin or Department Head access required")
-    
     # Get doctor profile
     doctor = await db.doctor_profiles.find_one({"user_id": request.doctor_id}, {"_id": 0})
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
     
     # If current user is department head, they can only promote doctors in their specialty
-    if current_user["role"] == UserRole.DEPARTMENT_HEAD:
-        current_doctor = await db.doctor_profiles.find_one({"user_id": current_user["id"]}, {"_id": 0})
-        if current_doctor["specialty_id"] != doctor["specialty_id"]:
-            raise HTTPException(status_code=403, detail="You can only manage doctors in your specialty")
+    await require_same_department(current_user, doctor.get("specialty_id"), "You can only manage doctors in your specialty")
     
     # Set as department head
     await db.doctor_profiles.update_one(
@@ -1177,15 +2908,14 @@ async def promote_to_department_head(request: PromoteToDepartmentHeadRequest, cu
         {"id": request.doctor_id},
         {"$set": {"role": UserRole.DEPARTMENT_HEAD}}
     )
+    await revoke_user_tokens(request.doctor_id)
+    department_cache.invalidate(request.doctor_id)
     
     return {"message": "Doctor promoted to Department Head successfully"}
 
 @api_router.post("/department-head/demote/{doctor_id}")
-async def demote_department_head(doctor_id: str, current_user: dict = Depends(get_current_user)):
+async def demote_department_head(doctor_id: str, current_user: dict = Depends(require(role=UserRole.ADMIN))):
     """Admin có thể hạ chức Trưởng khoa"""
-    if current_user["role"] != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     # Demote from department head
     await db.doctor_profiles.update_one(
         {"user_id": doctor_id},
@@ -1197,20 +2927,16 @@ async def demote_department_head(doctor_id: str, current_user: dict = Depends(ge
         {"id": doctor_id},
         {"$set": {"role": UserRole.DOCTOR}}
     )
+    await revoke_user_tokens(doctor_id)
+    department_cache.invalidate(doctor_id)
     
     return {"message": "Department Head demoted to Doctor successfully"}
 
 @api_router.post("/department-head/add-doctor")
-async def add_doctor_by_department_head(doctor_data: AddDoctorRequest, current_user: dict = Depends(get_current_user)):
+async def add_doctor_by_department_head(doctor_data: AddDoctorRequest, current_user: dict = Depends(require(role=[UserRole.ADMIN, UserRole.DEPARTMENT_HEAD]))):
     """Trưởng khoa thêm bác sĩ vào chuyên khoa của mình"""
-    if current_user["role"] not in [UserRole.ADMIN, UserRole.DEPARTMENT_HEAD]:
-        raise HTTPException(status_code=403, detail="Admin or Department Head access required")
-    
     # If department head, verify they're adding to their own specialty
-    if current_user["role"] == UserRole.DEPARTMENT_HEAD:
-        current_doctor = await db.doctor_profiles.find_one({"user_id": current_user["id"]}, {"_id": 0})
-        if current_doctor["specialty_id"] != doctor_data.specialty_id:
-            raise HTTPException(status_code=403, detail="You can only add doctors to your specialty")
+    await require_same_department(current_user, doctor_data.specialty_id, "You can only add doctors to your specialty")
     
     # Validate email
     if '@' not in doctor_data.email or '.' not in doctor_data.email.split('@')[1]:
@@ -1222,7 +2948,7 @@ async def add_doctor_by_department_head(doctor_data: AddDoctorRequest, current_u
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash password
-    hashed_password = hash_password(doctor_data.password)
+    hashed_password = await asyncio.to_thread(hash_password, doctor_data.password)
     
     # Create doctor user
     user = User(
@@ -1234,6 +2960,8 @@ async def add_doctor_by_department_head(doctor_data: AddDoctorRequest, current_u
     user_dict = user.model_dump()
     user_dict["password"] = hashed_password
     user_dict["created_at"] = user_dict["created_at"].isoformat()
+    user_dict["login_keys"] = login_keys_for(user.email, user.username)
+    user_dict["search_terms"] = user_search_terms(user.full_name, user.email, user.phone)
     
     await db.users.insert_one(user_dict)
     
@@ -1250,72 +2978,55 @@ async def add_doctor_by_department_head(doctor_data: AddDoctorRequest, current_u
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.doctor_profiles.insert_one(doctor_profile)
+    await refresh_doctor_search({"user_id": doctor_profile["user_id"]})
     
     return {"message": "Doctor added successfully", "doctor_id": user.id}
 
 @api_router.get("/department-head/my-doctors")
-async def get_my_department_doctors(current_user: dict = Depends(get_current_user)):
+async def get_my_department_doctors(fields: Optional[str] = None, current_user: dict = Depends(require(role=UserRole.DEPARTMENT_HEAD))):
     """Trưởng khoa xem danh sách bác sĩ trong chuyên khoa của mình"""
-    if current_user["role"] != UserRole.DEPARTMENT_HEAD:
-        raise HTTPException(status_code=403, detail="Department Head access required")
-    
-    # Get department head's specialty
-    dept_head_profile = await db.doctor_profiles.find_one({"user_id": current_user["id"]}, {"_id": 0})
-    if not dept_head_profile:
-        raise HTTPException(status_code=404, detail="Department Head profile not found")
-    
-    # Get all doctors in same specialty
-    doctors = await db.doctor_profiles.find({
-        "specialty_id": dept_head_profile["specialty_id"]
-    }, {"_id": 0}).to_list(1000)
-    
-    # Enrich with user info
-    for doctor in doctors:
-        user = await db.users.find_one({"id": doctor["user_id"]}, {"_id": 0, "password": 0})
-        if user:
-            doctor["full_name"] = user["full_name"]
-            doctor["email"] = user["email"]
-            doctor["role"] = user["role"]
-        
-        # Get specialty name
-        specialty = await db.specialties.find_one({"id": doctor["specialty_id"]}, {"_id": 0})
-        if specialty:
-            doctor["specialty_name"] = specialty["name"]
+    requested = parse_fields(fields, DOCTOR_FIELDS + ["role"])
+    specialty_id = await department_cache.specialty_of(current_user["id"])
+    doctors = await db.doctor_profiles.find(
+        {"specialty_id": specialty_id},
+        sparse_projection(requested, DOCTOR_PROFILE_PROJECTION, DOCTOR_FIELD_SOURCES, ("user_id",))
+    ).to_list(1000)
+    
+    await attach_doctor_details(doctors, requested)
+    if requested is None or "role" in requested:
+        roles = {
+            user["id"]: user["role"]
+            async for user in db.users.find({"id": {"$in": [d["user_id"] for d in doctors]}}, {"_id": 0, "id": 1, "role": 1})
+        }
+        for doctor in doctors:
+            if doctor["user_id"] in roles:
+                doctor["role"] = roles[doctor["user_id"]]
     
+    trim_fields(doctors, requested, ("user_id",))
     return doctors
 
 @api_router.put("/department-head/approve-doctor/{doctor_id}")
-async def department_head_approve_doctor(doctor_id: str, status: str, current_user: dict = Depends(get_current_user)):
+async def department_head_approve_doctor(doctor_id: str, status: str, current_user: dict = Depends(require(role=[UserRole.ADMIN, UserRole.DEPARTMENT_HEAD]))):
     """Trưởng khoa duyệt/từ chối bác sĩ trong chuyên khoa"""
-    if current_user["role"] not in [UserRole.ADMIN, UserRole.DEPARTMENT_HEAD]:
-        raise HTTPException(status_code=403, detail="Admin or Department Head access required")
-    
-    # Get doctor
-    doctor = await db.doctor_profiles.find_one({"user_id": doctor_id}, {"_id": 0})
-    if not doctor:
-        raise HTTPException(status_code=404, detail="Doctor not found")
+    query = {"user_id": doctor_id}
     
-    # If department head, verify same specialty
+    # If department head, only match doctors in the same specialty
     if current_user["role"] == UserRole.DEPARTMENT_HEAD:
-        current_doctor = await db.doctor_profiles.find_one({"user_id": current_user["id"]}, {"_id": 0})
-        if current_doctor["specialty_id"] != doctor["specialty_id"]:
-            raise HTTPException(status_code=403, detail="You can only manage doctors in your specialty")
+        query["specialty_id"] = await department_cache.specialty_of(current_user["id"])
     
     # Update status
-    await db.doctor_profiles.update_one(
-        {"user_id": doctor_id},
-        {"$set": {"status": status}}
-    )
+    updated_doctor = await update_and_fetch(db.doctor_profiles, query, {"$set": {"status": status}}, DOCTOR_PROFILE_PROJECTION)
+    if updated_doctor is None:
+        doctor = await db.doctor_profiles.find_one({"user_id": doctor_id}, {"_id": 0, "user_id": 1})
+        if not doctor:
+            raise HTTPException(status_code=404, detail="Doctor not found")
+        raise HTTPException(status_code=403, detail="You can only manage doctors in your specialty")
     
-    updated_doctor = await db.doctor_profiles.find_one({"user_id": doctor_id}, {"_id": 0})
     return updated_doctor
 
 @api_router.delete("/department-head/remove-doctor/{doctor_id}")
-async def department_head_remove_doctor(doctor_id: str, current_user: dict = Depends(get_current_user)):
+async def department_head_remove_doctor(doctor_id: str, current_user: dict = Depends(require(role=[UserRole.ADMIN, UserRole.DEPARTMENT_HEAD]))):
     """Trưởng khoa xóa bác sĩ khỏi chuyên khoa"""
-    if current_user["role"] not in [UserRole.ADMIN, UserRole.DEPARTMENT_HEAD]:
-        raise HTTPException(status_code=403, detail="Admin or Department Head access required")
-    
     # Get doctor
     doctor = await db.doctor_profiles.find_one({"user_id": doctor_id}, {"_id": 0})
     if not doctor:
@@ -1330,14 +3041,10 @@ async def department_head_remove_doctor(doctor_id: str, current_user: dict = Dep
         raise HTTPException(status_code=400, detail="Cannot remove another Department Head")
     
     # If department head, verify same specialty
-    if current_user["role"] == UserRole.DEPARTMENT_HEAD:
-        current_doctor = await db.doctor_profiles.find_one({"user_id": current_user["id"]}, {"_id": 0})
-        if current_doctor["specialty_id"] != doctor["specialty_id"]:
-            raise HTTPException(status_code=403, detail="You can only manage doctors in your specialty")
+    await require_same_department(current_user, doctor.get("specialty_id"), "You can only manage doctors in your specialty")
     
-    # Delete doctor profile and user account
-    await db.doctor_profiles.delete_one({"user_id": doctor_id})
-    await db.users.delete_one({"id": doctor_id})
+    # Delete doctor profile, user account and their appointments/chats
+    await cascade_delete_user(doctor_id)
     
     return {"message": "Doctor removed successfully"}
 
@@ -1365,11 +3072,8 @@ class DepartmentHeadCreateUserRequest(BaseModel):
         return v.lower()
 
 @api_router.post("/department-head/create-user")
-async def department_head_create_user(user_data: DepartmentHeadCreateUserRequest, current_user: dict = Depends(get_current_user)):
+async def department_head_create_user(user_data: DepartmentHeadCreateUserRequest, current_user: dict = Depends(require(role=UserRole.DEPARTMENT_HEAD))):
     """Department Head creates doctor or patient accounts"""
-    if current_user["role"] != UserRole.DEPARTMENT_HEAD:
-        raise HTTPException(status_code=403, detail="Department Head access required")
-    
     # Only allow doctor and patient roles
     if user_data.role not in ['doctor', 'patient']:
         raise HTTPException(status_code=403, detail="Department Head can only create doctor or patient accounts")
@@ -1380,7 +3084,7 @@ async def department_head_create_user(user_data: DepartmentHeadCreateUserRequest
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash password
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await asyncio.to_thread(hash_password, user_data.password)
     
     # Create user
     user = User(
@@ -1392,6 +3096,8 @@ async def department_head_create_user(user_data: DepartmentHeadCreateUserRequest
     user_dict = user.model_dump()
     user_dict["password"] = hashed_password
     user_dict["created_at"] = user_dict["created_at"].isoformat()
+    user_dict["login_keys"] = login_keys_for(user.email, user.username)
+    user_dict["search_terms"] = user_search_terms(user.full_name, user.email, user_data.phone)
     
     # Add optional fields
     if user_data.phone:
@@ -1415,6 +3121,7 @@ async def department_head_create_user(user_data: DepartmentHeadCreateUserRequest
             "created_at": datetime.now(timezone.utc).isoformat()
         }
         await db.doctor_profiles.insert_one(doctor_profile)
+        await refresh_doctor_search({"user_id": doctor_profile["user_id"]})
     
     # Remove MongoDB _id before returning
     user_dict.pop("_id", None)
@@ -1422,76 +3129,89 @@ async def department_head_create_user(user_data: DepartmentHeadCreateUserRequest
     return {"message": f"{user_data.role.capitalize()} account created successfully", "user": user_dict}
 
 @api_router.get("/department-head/doctors")
-async def department_head_get_doctors(current_user: dict = Depends(get_current_user)):
-    """Department Head views all doctors"""
-    if current_user["role"] != UserRole.DEPARTMENT_HEAD:
-        raise HTTPException(status_code=403, detail="Department Head access required")
-    
-    doctors = await db.doctor_profiles.find({}, {"_id": 0}).to_list(1000)
-    
-    # Get user info for each doctor
+async def department_head_get_doctors(fields: Optional[str] = None, current_user: dict = Depends(require(role=UserRole.DEPARTMENT_HEAD))):
+    """Department Head views the doctors of their department"""
+    requested = parse_fields(fields, [field for field in DOCTOR_FIELDS if field not in ("full_name", "email")] + ["user_info"])
+    specialty_id = await department_cache.specialty_of(current_user["id"])
+    doctors = await db.doctor_profiles.find(
+        {"specialty_id": specialty_id},
+        sparse_projection(requested, DOCTOR_PROFILE_PROJECTION, DOCTOR_FIELD_SOURCES, ("user_id",))
+    ).to_list(1000)
+    
+    # One query each for user info and the specialty name
+    users = {}
+    if requested is None or "user_info" in requested:
+        users = {
+            user["id"]: user
+            async for user in db.users.find({"id": {"$in": [d["user_id"] for d in doctors]}}, USER_LIST_PROJECTION)
+        }
+    specialty = None
+    if requested is None or "specialty_name" in requested:
+        specialty = await db.specialties.find_one({"id": specialty_id}, {"_id": 0, "name": 1})
     for doctor in doctors:
-        user = await db.users.find_one({"id": doctor["user_id"]}, {"_id": 0, "password": 0})
-        if user:
-            doctor["user_info"] = user
-        
-        # Get specialty info
-        if doctor.get("specialty_id"):
-            specialty = await db.specialties.find_one({"id": doctor["specialty_id"]}, {"_id": 0})
-            if specialty:
-                doctor["specialty_name"] = specialty["name"]
+        if doctor["user_id"] in users:
+            doctor["user_info"] = users[doctor["user_id"]]
+        if specialty:
+            doctor["specialty_name"] = specialty["name"]
     
+    trim_fields(doctors, requested, ("user_id",))
     return doctors
 
 @api_router.get("/department-head/patients")
-async def department_head_get_patients(current_user: dict = Depends(get_current_user)):
+async def department_head_get_patients(
+    q: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(PATIENT_PAGE_SIZE, ge=1, le=200),
+    fields: Optional[str] = None,
+    current_user: dict = Depends(require(role=UserRole.DEPARTMENT_HEAD))
+):
     """Department Head views all patients"""
-    if current_user["role"] != UserRole.DEPARTMENT_HEAD:
-        raise HTTPException(status_code=403, detail="Department Head access required")
-    
-    patients = await db.users.find({"role": UserRole.PATIENT}, {"_id": 0, "password": 0}).to_list(1000)
-    return patients
+    return await list_patients(q, created_from, created_to, cursor, limit, fields)
 
 @api_router.delete("/department-head/remove-patient/{patient_id}")
-async def department_head_remove_patient(patient_id: str, current_user: dict = Depends(get_current_user)):
+async def department_head_remove_patient(patient_id: str, current_user: dict = Depends(require(role=UserRole.DEPARTMENT_HEAD))):
     """Department Head removes a patient"""
-    if current_user["role"] != UserRole.DEPARTMENT_HEAD:
-        raise HTTPException(status_code=403, detail="Department Head access required")
-    
     # Get patient
-    patient = await db.users.find_one({"id": patient_id, "role": UserRole.PATIENT}, {"_id": 0})
+    patient = await db.users.find_one({"id": patient_id, "role": UserRole.PATIENT, "deleted_at": None}, {"_id": 0})
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
     
     # Delete patient and related data
-    await db.users.delete_one({"id": patient_id})
-    await db.appointments.delete_many({"patient_id": patient_id})
-    await db.chat_messages.delete_many({"$or": [{"sender_id": patient_id}, {"receiver_id": patient_id}]})
+    await cascade_delete_user(patient_id)
     
     return {"message": "Patient removed successfully"}
 
 @api_router.get("/department-head/stats")
-async def department_head_get_stats(current_user: dict = Depends(get_current_user)):
-    """Department Head views statistics"""
-    if current_user["role"] != UserRole.DEPARTMENT_HEAD:
-        raise HTTPException(status_code=403, detail="Department Head access required")
-    
-    # Get counts
-    total_doctors = await db.doctor_profiles.count_documents({})
-    approved_doctors = await db.doctor_profiles.count_documents({"status": "approved"})
-    pending_doctors = await db.doctor_profiles.count_documents({"status": "pending"})
-    total_patients = await db.users.count_documents({"role": UserRole.PATIENT})
-    total_appointments = await db.appointments.count_documents({})
-    completed_appointments = await db.appointments.count_documents({"status": "completed"})
-    
-    return {
-        "total_doctors": total_doctors,
-        "approved_doctors": approved_doctors,
-        "pending_doctors": pending_doctors,
-        "total_patients": total_patients,
-        "total_appointments": total_appointments,
-        "completed_appointments": completed_appointments
-    }
+async def department_head_get_stats(current_user: dict = Depends(require(role=UserRole.DEPARTMENT_HEAD))):
+    """Department Head views statistics of their department"""
+    return await department_stats(await department_cache.specialty_of(current_user["id"]))
+
+@api_router.get("/department-head/analytics")
+async def department_head_get_analytics(
+    date_from: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    date_to: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    current_user: dict = Depends(require(role=UserRole.DEPARTMENT_HEAD))
+):
+    """Workload and utilization of each doctor in the department, last 4 weeks by default"""
+    today = datetime.now(APPOINTMENT_TIMEZONE).date()
+    date_to = date_to or today.isoformat()
+    date_from = date_from or (today - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)).isoformat()
+    try:
+        days = (datetime.strptime(date_to, "%Y-%m-%d") - datetime.strptime(date_from, "%Y-%m-%d")).days + 1
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date")
+    if not 1 <= days <= ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"date_to must be on or after date_from and at most {ANALYTICS_MAX_DAYS} days later")
+    
+    specialty_id = await department_cache.specialty_of(current_user["id"])
+    key = (date_from, date_to)
+    analytics = department_analytics_cache.get(specialty_id, key)
+    if analytics is None:
+        analytics = await department_analytics(specialty_id, date_from, date_to)
+        department_analytics_cache.put(specialty_id, key, [doctor["doctor_id"] for doctor in analytics["doctors"]], analytics)
+    return analytics
 
 # AI Features
 import openai
@@ -1520,7 +3240,7 @@ class AIChatResponse(BaseModel):
 
 # AI Endpoints
 @api_router.post("/ai/chat", response_model=AIChatResponse)
-async def ai_health_consultation(chat_data: AIChatMessage, current_user: dict = Depends(get_current_user)):
+async def ai_health_consultation(chat_data: AIChatMessage, current_user: dict = Depends(get_current_user_claims)):
     """AI-powered health consultation chatbot"""
     if not openai_client:
         raise HTTPException(status_code=503, detail="AI service not configured")
@@ -1584,7 +3304,7 @@ Important guidelines:
         raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
 
 @api_router.post("/ai/recommend-doctor")
-async def ai_recommend_doctor(request_data: AIRecommendDoctorRequest, current_user: dict = Depends(get_current_user)):
+async def ai_recommend_doctor(request_data: AIRecommendDoctorRequest, current_user: dict = Depends(get_current_user_claims)):
     """AI-powered doctor recommendation based on symptoms"""
     if not openai_client:
         raise HTTPException(status_code=503, detail="AI service not configured")
@@ -1594,7 +3314,7 @@ async def ai_recommend_doctor(request_data: AIRecommendDoctorRequest, current_us
     specialty_list = [s["name"] for s in specialties]
     
     # Get all approved doctors with their specialties
-    doctors = await db.doctor_profiles.find({"status": "approved"}, {"_id": 0}).to_list(1000)
+    doctors = await db.doctor_profiles.find({"status": "approved"}, DOCTOR_PROFILE_PROJECTION).to_list(1000)
     
     # Enrich doctors with user info and specialty name
     doctor_info_list = []
@@ -1661,7 +3381,7 @@ Format your response as JSON:
         raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
 
 @api_router.post("/ai/summarize-conversation/{appointment_id}")
-async def ai_summarize_conversation(appointment_id: str, current_user: dict = Depends(get_current_user)):
+async def ai_summarize_conversation(appointment_id: str, current_user: dict = Depends(get_current_user_claims)):
     """AI-powered conversation summarization"""
     if not openai_client:
         raise HTTPException(status_code=503, detail="AI service not configured")
@@ -1729,7 +3449,7 @@ Format as JSON:
         raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
 
 @api_router.get("/ai/chat-history")
-async def get_ai_chat_history(session_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+async def get_ai_chat_history(session_id: Optional[str] = None, current_user: dict = Depends(get_current_user_claims)):
     """Get patient's AI chat history"""
     query = {"patient_id": current_user["id"]}
     if session_id:
@@ -1745,8 +3465,676 @@ async def get_ai_chat_history(session_id: Optional[str] = None, current_user: di
             sessions[sid] = []
         sessions[sid].append(chat)
     
-    return {"sessions": sessions, "total_messages": len(chat_history)}
+    return CompactJSONResponse({"sessions": sessions, "total_messages": len(chat_history)})
+
+
+# Background Jobs
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_TICK_SECONDS = int(os.environ.get("SCHEDULER_TICK_SECONDS", 30))
+SCHEDULER_LEASE_SECONDS = int(os.environ.get("SCHEDULER_LEASE_SECONDS", 90))
+SCHEDULER_BATCH_SIZE = int(os.environ.get("SCHEDULER_BATCH_SIZE", 200))
+REMINDER_LEAD_HOURS = int(os.environ.get("REMINDER_LEAD_HOURS", 24))
+APPOINTMENT_EXPIRY_GRACE_MINUTES = int(os.environ.get("APPOINTMENT_EXPIRY_GRACE_MINUTES", 60))
+
+class BackgroundScheduler:
+    """Runs periodic jobs in-process on whichever worker holds the MongoDB lease"""
+
+    def __init__(self, name: str, tick_seconds: int, lease_seconds: int):
+        self.name = name
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.tick_seconds = tick_seconds
+        self.lease_seconds = lease_seconds
+        self.jobs: List[dict] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def job(self, interval_seconds: int):
+        """Register a coroutine function to run every interval_seconds"""
+        def decorator(func):
+            self.jobs.append({"name": func.__name__, "func": func, "interval": interval_seconds, "next_run": 0.0})
+            return func
+        return decorator
+
+    async def acquire_lease(self) -> bool:
+        """Take or renew the lease; the upsert collides on _id if another worker holds it"""
+        now = datetime.now(timezone.utc)
+        try:
+            await db.scheduler_leases.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.worker_id}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.worker_id, "expires_at": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def release_lease(self):
+        await db.scheduler_leases.delete_one({"_id": self.name, "owner": self.worker_id})
+
+    async def run_due_jobs(self):
+        for job in self.jobs:
+            if time.monotonic() < job["next_run"]:
+                continue
+            # Renew before every job so a slow job never runs without the lease
+            if not await self.acquire_lease():
+                return
+            job["next_run"] = time.monotonic() + job["interval"]
+            try:
+                await job["func"]()
+            except Exception as e:
+                logger.error(f"Background job {job['name']} failed: {e}", exc_info=True)
+
+    async def _loop(self):
+        while True:
+            try:
+                if db is not None:
+                    await self.run_due_jobs()
+            except Exception as e:
+                logger.error(f"Scheduler tick failed: {e}")
+            await asyncio.sleep(self.tick_seconds)
+
+    def start(self):
+        if self._task is None:
+            logger.info(f"Starting scheduler {self.name} as {self.worker_id}")
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if db is not None:
+            await self.release_lease()
+
+scheduler = BackgroundScheduler("appointment-scheduler", SCHEDULER_TICK_SECONDS, SCHEDULER_LEASE_SECONDS)
+
+@scheduler.job(interval_seconds=60)
+async def enqueue_appointment_reminders():
+    """Queue reminders for confirmed appointments starting within REMINDER_LEAD_HOURS"""
+    now = datetime.now(timezone.utc)
+    query = {
+        "status": AppointmentStatus.CONFIRMED,
+        "starts_at": {"$gte": now, "$lt": now + timedelta(hours=REMINDER_LEAD_HOURS)},
+        "reminder_enqueued_at": None
+    }
+    projection = {
+        "_id": 0, "id": 1, "patient_id": 1, "patient_name": 1, "doctor_id": 1, "doctor_name": 1,
+        "appointment_type": 1, "appointment_date": 1, "appointment_time": 1
+    }
+
+    while True:
+        batch = await db.appointments.find(query, projection).sort("starts_at", 1).to_list(SCHEDULER_BATCH_SIZE)
+        if not batch:
+            break
+
+        reminders = [
+            outbox_message(
+                "appointment_reminder",
+                {**appointment, "recipient_ids": [appointment["patient_id"], appointment["doctor_id"]]},
+                message_id=f"appointment_reminder:{appointment['id']}"
+            )
+            for appointment in batch
+        ]
+        try:
+            await db.outbox.insert_many(reminders, ordered=False)
+        except BulkWriteError as e:
+            # Reminders already queued by an earlier, interrupted run are fine
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+        await db.appointments.update_many(
+            {"id": {"$in": [appointment["id"] for appointment in batch]}},
+            {"$set": {"reminder_enqueued_at": now}}
+        )
+        outbox_sender.notify()
+        logger.info(f"Queued {len(batch)} appointment reminders")
+        if len(batch) < SCHEDULER_BATCH_SIZE:
+            break
+
+@scheduler.job(interval_seconds=300)
+async def expire_unconfirmed_appointments():
+    """Cancel pending appointments whose start time passed without confirmation"""
+    now = datetime.now(timezone.utc)
+    query = {
+        "status": AppointmentStatus.PENDING,
+        "starts_at": {"$lt": now - timedelta(minutes=APPOINTMENT_EXPIRY_GRACE_MINUTES)}
+    }
+
+    while True:
+        batch = await db.appointments.find(query, {"_id": 0, "id": 1}).to_list(SCHEDULER_BATCH_SIZE)
+        if not batch:
+            break
+
+        await db.appointments.update_many(
+            {"id": {"$in": [appointment["id"] for appointment in batch]}, "status": AppointmentStatus.PENDING},
+            {"$set": {
+                "status": AppointmentStatus.CANCELLED,
+                "cancelled_reason": "not_confirmed",
+                "updated_at": now.isoformat(),
+                "status_changed_at": now.isoformat()
+            }}
+        )
+        department_analytics_cache.clear()
+        # Skip the ones confirmed between the read and the update
+        cancelled = await db.appointments.find(
+            {"id": {"$in": [appointment["id"] for appointment in batch]}, "status_changed_at": now.isoformat()},
+            {"_id": 0, "doctor_id": 1, "appointment_type": 1}
+        ).to_list(len(batch))
+        await record_appointment_events([
+            (appointment["doctor_id"], appointment["appointment_type"], "cancelled") for appointment in cancelled
+        ])
+        logger.info(f"Cancelled {len(batch)} expired unconfirmed appointments")
+        if len(batch) < SCHEDULER_BATCH_SIZE:
+            break
+
+# Appointment Rollups
+# One document per (day, doctor, appointment type) counting the appointments
+# created, completed and cancelled that day (days in APPOINTMENT_TIMEZONE).
+# Writes $inc them; the nightly compaction rebuilds the previous day from the
+# appointments themselves, correcting increments lost to crashes or races.
+ROLLUP_EVENTS = {AppointmentStatus.COMPLETED: "completed", AppointmentStatus.CANCELLED: "cancelled"}
+ROLLUP_COUNTERS = ["created", "completed", "cancelled"]
+
+def rollup_day(moment: Optional[datetime] = None) -> str:
+    return (moment or datetime.now(timezone.utc)).astimezone(APPOINTMENT_TIMEZONE).date().isoformat()
+
+def rollup_id(day: str, doctor_id: str, appointment_type: str) -> str:
+    return f"{day}:{doctor_id}:{appointment_type}"
+
+async def doctor_specialties(doctor_ids) -> Dict[str, Optional[str]]:
+    return {
+        profile["user_id"]: profile.get("specialty_id")
+        async for profile in db.doctor_profiles.find({"user_id": {"$in": list(doctor_ids)}}, {"_id": 0, "user_id": 1, "specialty_id": 1})
+    }
+
+async def record_appointment_events(events: List[tuple]):
+    """Count (doctor_id, appointment_type, counter) events in today's rollups"""
+    if not events:
+        return
+    day = rollup_day()
+    try:
+        specialties = await doctor_specialties({doctor_id for doctor_id, _, _ in events})
+        await db.appointment_rollups.bulk_write([
+            UpdateOne(
+                {"_id": rollup_id(day, doctor_id, appointment_type)},
+                {
+                    "$inc": {counter: count},
+                    "$setOnInsert": {
+                        "day": day,
+                        "doctor_id": doctor_id,
+                        "appointment_type": appointment_type,
+                        "specialty_id": specialties.get(doctor_id)
+                    }
+                },
+                upsert=True
+            )
+            for (doctor_id, appointment_type, counter), count in Counter(events).items()
+        ], ordered=False)
+    except Exception as e:
+        # The appointment write already succeeded; compaction repairs the rollup
+        logger.error(f"Failed to update appointment rollups: {e}")
+
+def in_day(field: str, start: str, end: str) -> dict:
+    return {"$and": [{"$gte": [field, start]}, {"$lt": [field, end]}]}
+
+async def rebuild_appointment_rollups(day: str):
+    """Recompute one day's rollups from the appointments collection"""
+    start_at = appointment_starts_at(day, "00:00")
+    start, end = start_at.isoformat(), (start_at + timedelta(days=1)).isoformat()
+    # Appointments changed before status_changed_at existed fall back to updated_at
+    changed_at = {"$ifNull": ["$status_changed_at", "$updated_at"]}
+    groups = await db.appointments.aggregate([
+        {"$match": {"$or": [
+            {"created_at": {"$gte": start, "$lt": end}},
+            {"status_changed_at": {"$gte": start, "$lt": end}},
+            {"status_changed_at": {"$exists": False}, "updated_at": {"$gte": start, "$lt": end}}
+        ]}},
+        {"$group": {
+            "_id": {"doctor_id": "$doctor_id", "appointment_type": "$appointment_type"},
+            "created": {"$sum": {"$cond": [in_day("$created_at", start, end), 1, 0]}},
+            "completed": {"$sum": {"$cond": [
+                {"$and": [{"$eq": ["$status", AppointmentStatus.COMPLETED]}, in_day(changed_at, start, end)]}, 1, 0
+            ]}},
+            "cancelled": {"$sum": {"$cond": [
+                {"$and": [{"$eq": ["$status", AppointmentStatus.CANCELLED]}, in_day(changed_at, start, end)]}, 1, 0
+            ]}}
+        }}
+    ]).to_list(None)
+    
+    specialties = await doctor_specialties({group["_id"]["doctor_id"] for group in groups})
+    rollups = [
+        {
+            "_id": rollup_id(day, group["_id"]["doctor_id"], group["_id"]["appointment_type"]),
+            "day": day,
+            "doctor_id": group["_id"]["doctor_id"],
+            "appointment_type": group["_id"]["appointment_type"],
+            "specialty_id": specialties.get(group["_id"]["doctor_id"]),
+            **{counter: group[counter] for counter in ROLLUP_COUNTERS}
+        }
+        for group in groups
+        if any(group[counter] for counter in ROLLUP_COUNTERS)
+    ]
+    if rollups:
+        await db.appointment_rollups.bulk_write(
+            [ReplaceOne({"_id": rollup["_id"]}, rollup, upsert=True) for rollup in rollups],
+            ordered=False
+        )
+    await db.appointment_rollups.delete_many({"day": day, "_id": {"$nin": [rollup["_id"] for rollup in rollups]}})
+    return len(rollups)
+
+@scheduler.job(interval_seconds=3600)
+async def compact_appointment_rollups():
+    """Rebuild yesterday's rollups once, after the day has closed"""
+    day = rollup_day(datetime.now(timezone.utc) - timedelta(days=1))
+    if await db.rollup_compactions.find_one({"_id": day}):
+        return
+    count = await rebuild_appointment_rollups(day)
+    await db.rollup_compactions.insert_one({"_id": day, "compacted_at": datetime.now(timezone.utc)})
+    logger.info(f"Compacted appointment rollups for {day}: {count} documents")
 
+NAME_PROPAGATION_WORKERS = int(os.environ.get("NAME_PROPAGATION_WORKERS", 2))
+NAME_PROPAGATION_BATCH_SIZE = int(os.environ.get("NAME_PROPAGATION_BATCH_SIZE", 500))
+
+# Denormalized copies of users.full_name: (collection, user id field, name field)
+DENORMALIZED_NAME_FIELDS = [
+    ("appointments", "patient_id", "patient_name"),
+    ("appointments", "doctor_id", "doctor_name"),
+    ("chat_messages", "sender_id", "sender_name"),
+]
+
+class NamePropagationWorker:
+    """Copies renamed users' full_name into denormalized appointment and chat fields"""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+    async def submit(self, user_id: str, full_name: str):
+        # The job document survives restarts; the latest rename wins
+        await db.name_propagation_jobs.update_one(
+            {"user_id": user_id},
+            {"$set": {"full_name": full_name, "queued_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        self.queue.put_nowait(user_id)
+
+    async def propagate(self, user_id: str):
+        job = await db.name_propagation_jobs.find_one({"user_id": user_id})
+        if not job:
+            return
+        full_name = job["full_name"]
+
+        for collection_name, id_field, name_field in DENORMALIZED_NAME_FIELDS:
+            collection = db[collection_name]
+            query = {id_field: user_id, name_field: {"$ne": full_name}}
+            while True:
+                batch = await collection.find(query, {"_id": 1}).to_list(NAME_PROPAGATION_BATCH_SIZE)
+                if not batch:
+                    break
+                await collection.update_many(
+                    {"_id": {"$in": [doc["_id"] for doc in batch]}},
+                    {"$set": {name_field: full_name, "updated_at": datetime.now(timezone.utc).isoformat()}}
+                )
+                if len(batch) < NAME_PROPAGATION_BATCH_SIZE:
+                    break
+
+        # Keep the job if the user was renamed again meanwhile
+        await db.name_propagation_jobs.delete_one({"user_id": user_id, "full_name": full_name})
+
+    async def _consume(self):
+        while True:
+            user_id = await self.queue.get()
+            try:
+                await self.propagate(user_id)
+            except Exception as e:
+                logger.error(f"Name propagation for user {user_id} failed: {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+name_propagation = NamePropagationWorker(NAME_PROPAGATION_WORKERS)
+
+@scheduler.job(interval_seconds=300)
+async def resume_name_propagation():
+    """Re-queue renames left unfinished by a worker that stopped or failed"""
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=5)
+    jobs = await db.name_propagation_jobs.find(
+        {"queued_at": {"$lt": cutoff}},
+        {"_id": 0, "user_id": 1}
+    ).to_list(SCHEDULER_BATCH_SIZE)
+    for job in jobs:
+        name_propagation.queue.put_nowait(job["user_id"])
+
+# Account Deletion
+# Deleting an account only marks it (deleted_at) and cuts off access; its
+# appointments, chats and AI history are purged later in small, paced batches
+ACCOUNT_PURGE_BATCH_SIZE = int(os.environ.get("ACCOUNT_PURGE_BATCH_SIZE", 500))
+ACCOUNT_PURGE_PAUSE_SECONDS = float(os.environ.get("ACCOUNT_PURGE_PAUSE_SECONDS", 0.1))
+ACCOUNT_PURGE_POLL_SECONDS = int(os.environ.get("ACCOUNT_PURGE_POLL_SECONDS", 60))
+
+_transactions_supported: Optional[bool] = None
+
+async def transactions_supported() -> bool:
+    """Multi-document transactions need a replica set or sharded cluster"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        try:
+            hello = await client.admin.command("hello")
+            _transactions_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _transactions_supported = False
+    return _transactions_supported
+
+def user_appointments_query(user_id: str) -> dict:
+    return {"$or": [{"patient_id": user_id}, {"doctor_id": user_id}]}
+
+async def soft_delete_account(user_id: str, session=None):
+    now = datetime.now(timezone.utc)
+    await db.users.update_one(
+        {"id": user_id, "deleted_at": None},
+        {"$set": {"deleted_at": now}, "$inc": {"token_version": 1}},
+        session=session
+    )
+    # Gone from doctor listings right away
+    await db.doctor_profiles.delete_one({"user_id": user_id}, session=session)
+    await db.calendar_feeds.delete_one({"doctor_id": user_id}, session=session)
+    await db.refresh_tokens.delete_many({"user_id": user_id}, session=session)
+    await db.password_reset_tokens.delete_many({"user_id": user_id}, session=session)
+
+async def cascade_delete_user(user_id: str):
+    """Soft-delete a user; related data is removed by the account purge worker"""
+    if await transactions_supported():
+        async with await client.start_session() as session:
+            await session.with_transaction(lambda s: soft_delete_account(user_id, s))
+    else:
+        await soft_delete_account(user_id)
+    department_cache.invalidate(user_id)
+    account_purge.notify()
+
+class AccountPurgeWorker:
+    """Hard-deletes soft-deleted accounts and everything tied to them
+
+    Work is paced (ACCOUNT_PURGE_PAUSE_SECONDS between batches of
+    ACCOUNT_PURGE_BATCH_SIZE) so large accounts don't starve foreground
+    queries. The email/username stay reserved until the purge finishes.
+    """
+
+    def __init__(self, batch_size: int, pause_seconds: float, poll_seconds: int):
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.poll_seconds = poll_seconds
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def claim(self) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        # Served by the partial deleted_users index
+        return await db.users.find_one_and_update(
+            {
+                "deleted_at": {"$exists": True},
+                "$or": [
+                    {"purge_claimed_at": {"$exists": False}},
+                    # Claimed by a worker that died before finishing
+                    {"purge_claimed_at": {"$lt": now - timedelta(minutes=5)}}
+                ]
+            },
+            {"$set": {"purge_claimed_at": now}},
+            sort=[("deleted_at", 1)],
+            projection={"_id": 0, "id": 1}
+        )
+
+    async def delete_in_batches(self, collection, query: dict, before_delete=None):
+        while True:
+            batch = await collection.find(query, {"_id": 1, "id": 1}).to_list(self.batch_size)
+            if not batch:
+                return
+            if before_delete:
+                await before_delete(batch)
+            await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+            await asyncio.sleep(self.pause_seconds)
+
+    async def purge(self, user_id: str):
+        async def delete_chats(appointments):
+            # Chats first, so an interrupted purge never leaves orphaned messages
+            await db.chat_messages.delete_many(
+                {"appointment_id": {"$in": [appointment["id"] for appointment in appointments]}}
+            )
+        
+        await self.delete_in_batches(db.appointments, user_appointments_query(user_id), delete_chats)
+        department_analytics_cache.clear()
+        await self.delete_in_batches(db.ai_chat_history, {"patient_id": user_id})
+        await db.name_propagation_jobs.delete_one({"user_id": user_id})
+        await db.users.delete_one({"id": user_id, "deleted_at": {"$exists": True}})
+        logger.info(f"Purged deleted account {user_id}")
+
+    async def _loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                while db is not None:
+                    user = await self.claim()
+                    if user is None:
+                        break
+                    await self.purge(user["id"])
+            except Exception as e:
+                logger.error(f"Account purge failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+account_purge = AccountPurgeWorker(ACCOUNT_PURGE_BATCH_SIZE, ACCOUNT_PURGE_PAUSE_SECONDS, ACCOUNT_PURGE_POLL_SECONDS)
+
+# Outbox and Email
+OUTBOX_POLL_SECONDS = int(os.environ.get("OUTBOX_POLL_SECONDS", 5))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_RETENTION_DAYS = int(os.environ.get("OUTBOX_RETENTION_DAYS", 7))
+PASSWORD_RESET_TOKEN_MINUTES = int(os.environ.get("PASSWORD_RESET_TOKEN_MINUTES", 30))
+FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:3000")
+EMAIL_SINK = os.environ.get("EMAIL_SINK", "console")  # console, file or smtp
+EMAIL_FILE = os.environ.get("EMAIL_FILE", str(ROOT_DIR / "sent_emails.jsonl"))
+EMAIL_FROM = os.environ.get("EMAIL_FROM", "no-reply@medischedule.com")
+SMTP_HOST = os.environ.get("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 587))
+SMTP_USER = os.environ.get("SMTP_USER")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")
+
+def deliver_email(to: str, subject: str, body: str):
+    """Send an email through EMAIL_SINK; blocking, run it in a thread"""
+    if EMAIL_SINK == "smtp":
+        message = EmailMessage()
+        message["From"] = EMAIL_FROM
+        message["To"] = to
+        message["Subject"] = subject
+        message.set_content(body)
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+            smtp.starttls()
+            if SMTP_USER:
+                smtp.login(SMTP_USER, SMTP_PASSWORD)
+            smtp.send_message(message)
+    elif EMAIL_SINK == "file":
+        record = {"to": to, "subject": subject, "body": body, "sent_at": datetime.now(timezone.utc).isoformat()}
+        with open(EMAIL_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    else:
+        logger.info(f"Email to {to}: {subject}\n{body}")
+
+def outbox_message(message_type: str, payload: dict, message_id: Optional[str] = None) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "id": message_id or str(uuid.uuid4()),
+        "type": message_type,
+        "payload": payload,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now.isoformat()
+    }
+
+async def enqueue_outbox(message_type: str, payload: dict):
+    await db.outbox.insert_one(outbox_message(message_type, payload))
+    outbox_sender.notify()
+
+async def send_password_reset(payload: dict):
+    user = await db.users.find_one({"email": payload["email"], "deleted_at": None}, {"_id": 0, "id": 1, "full_name": 1})
+    if not user:
+        return
+    
+    reset_token = secrets.token_urlsafe(32)
+    now = datetime.now(timezone.utc)
+    await db.password_reset_tokens.insert_one({
+        "token_hash": hash_token(reset_token),
+        "user_id": user["id"],
+        "used": False,
+        "created_at": now,
+        "expires_at": now + timedelta(minutes=PASSWORD_RESET_TOKEN_MINUTES)
+    })
+    
+    body = (
+        f"Xin chào {user['full_name']},\n\n"
+        f"Nhấn vào liên kết sau để đặt lại mật khẩu (hiệu lực trong {PASSWORD_RESET_TOKEN_MINUTES} phút):\n"
+        f"{FRONTEND_URL}/reset-password?token={reset_token}\n\n"
+        "Nếu bạn không yêu cầu đặt lại mật khẩu, hãy bỏ qua email này."
+    )
+    await asyncio.to_thread(deliver_email, payload["email"], "Đặt lại mật khẩu MediSchedule", body)
+
+async def send_appointment_reminder(payload: dict):
+    recipients = await db.users.find(
+        {"id": {"$in": payload["recipient_ids"]}, "deleted_at": None},
+        {"_id": 0, "email": 1, "full_name": 1}
+    ).to_list(len(payload["recipient_ids"]))
+    
+    kind = "tư vấn online" if payload.get("appointment_type") == AppointmentType.ONLINE else "khám trực tiếp"
+    for recipient in recipients:
+        body = (
+            f"Xin chào {recipient['full_name']},\n\n"
+            f"Nhắc lịch hẹn {kind} giữa bác sĩ {payload.get('doctor_name') or ''} và bệnh nhân "
+            f"{payload.get('patient_name') or ''} lúc {payload['appointment_time']} ngày {payload['appointment_date']}."
+        )
+        await asyncio.to_thread(deliver_email, recipient["email"], "Nhắc lịch hẹn MediSchedule", body)
+
+class OutboxSender:
+    """Delivers queued outbox messages outside the request path
+
+    Every worker runs one; messages are claimed atomically, so they can
+    drain the outbox side by side.
+    """
+
+    def __init__(self, handlers: Dict[str, Any], poll_seconds: int):
+        self.handlers = handlers
+        self.poll_seconds = poll_seconds
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def claim(self) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await db.outbox.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                # Claimed by a worker that died before finishing
+                {"status": "sending", "claimed_at": {"$lt": now - timedelta(minutes=5)}}
+            ]},
+            {"$set": {"status": "sending", "claimed_at": now}, "$inc": {"attempts": 1}},
+            sort=[("next_attempt_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def deliver(self, message: dict):
+        now = datetime.now(timezone.utc)
+        try:
+            await self.handlers[message["type"]](message["payload"])
+        except Exception as e:
+            gave_up = message["attempts"] >= OUTBOX_MAX_ATTEMPTS
+            logger.error(f"Outbox message {message['id']} failed (attempt {message['attempts']}): {e}")
+            await db.outbox.update_one({"id": message["id"]}, {"$set": {
+                "status": "failed" if gave_up else "pending",
+                "error": str(e),
+                "next_attempt_at": now + timedelta(seconds=30 * 2 ** message["attempts"])
+            }})
+            return
+        
+        await db.outbox.update_one({"id": message["id"]}, {"$set": {
+            "status": "sent",
+            "sent_at": now,
+            "expires_at": now + timedelta(days=OUTBOX_RETENTION_DAYS)
+        }})
+
+    async def _loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                while db is not None:
+                    message = await self.claim()
+                    if message is None:
+                        break
+                    await self.deliver(message)
+            except Exception as e:
+                logger.error(f"Outbox sender failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+outbox_sender = OutboxSender(
+    {"password_reset": send_password_reset, "appointment_reminder": send_appointment_reminder},
+    OUTBOX_POLL_SECONDS
+)
+
+@app.on_event("startup")
+async def start_background_workers():
+    name_propagation.start()
+    outbox_sender.start()
+    account_purge.start()
+    if SCHEDULER_ENABLED:
+        scheduler.start()
 
 # Include router in the main app after all routes are defined
 app.include_router(api_router, prefix=API_PREFIX)
@@ -818,7 +818,7 @@ class DepartmentHeadAPITester:
         # Test 1: ✅ Fetch all patients list
         response = self.make_request("GET", "/department-head/patients", token=self.dept_head_token)
         if response and response.status_code == 200:
-            data = response.json()
+            data = response.json().get("items")
             if isinstance(data, list):
                 self.log_result("Fetch Patients List", True, f"Successfully fetched {len(data)} patients")
                 
@@ -834,7 +834,7 @@ class DepartmentHeadAPITester:
                 else:
                     self.log_result("Patient Response Security", True, "No patients to verify format (empty list)")
             else:
-                self.log_result("Fetch Patients List", False, "Response should be a list")
+                self.log_result("Fetch Patients List", False, "Response should have an items list")
         else:
             error_msg = response.text if response else "Connection failed"
             self.log_result("Fetch Patients List", False, "Failed to fetch patients list", error_msg)
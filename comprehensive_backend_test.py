@@ -258,7 +258,7 @@ class ComprehensiveAPITester:
         # Test 2: GET /api/department-head/patients
         response = self.make_request("GET", "/department-head/patients", token=self.dept_head_token)
         if response and response.status_code == 200:
-            data = response.json()
+            data = response.json().get("items")
             if isinstance(data, list):
                 self.log_result("GET Patients List", True, f"Successfully fetched {len(data)} patients")
                 
@@ -272,7 +272,7 @@ class ComprehensiveAPITester:
                     else:
                         self.log_result("Patients Security Check", False, "Response should not include password field")
             else:
-                self.log_result("GET Patients List", False, "Response should be a list")
+                self.log_result("GET Patients List", False, "Response should have an items list")
         else:
             error_msg = response.text if response else "Connection failed"
             self.log_result("GET Patients List", False, "Failed to fetch patients", error_msg)
@@ -199,11 +199,11 @@ class HospitalSystemTester:
         # Test 3: Admin Get Patients
         response = self.make_request("GET", "/admin/patients", token=admin_token)
         if response and response.status_code == 200:
-            data = response.json()
+            data = response.json().get("items")
             if isinstance(data, list):
                 self.log_result("Admin Get Patients", True, f"Retrieved {len(data)} patients")
             else:
-                self.log_result("Admin Get Patients", False, "Response should be a list")
+                self.log_result("Admin Get Patients", False, "Response should have an items list")
         else:
             error_msg = response.text if response else "Connection failed"
             self.log_result("Admin Get Patients", False, "Failed to get patients", error_msg)
@@ -339,11 +339,11 @@ class HospitalSystemTester:
         # Test 4: Department Head Get Patients
         response = self.make_request("GET", "/department-head/patients", token=dept_token)
         if response and response.status_code == 200:
-            data = response.json()
+            data = response.json().get("items")
             if isinstance(data, list):
                 self.log_result("Department Head Get Patients", True, f"Retrieved {len(data)} patients")
             else:
-                self.log_result("Department Head Get Patients", False, "Response should be a list")
+                self.log_result("Department Head Get Patients", False, "Response should have an items list")
         else:
             error_msg = response.text if response else "Connection failed"
             self.log_result("Department Head Get Patients", False, "Failed to get patients", error_msg)
@@ -150,7 +150,7 @@ class FocusedAPITester:
         # Test 2: GET /api/department-head/patients
         response = self.make_request("GET", "/department-head/patients", token=self.dept_head_token)
         if response and response.status_code == 200:
-            data = response.json()
+            data = response.json().get("items", [])
             self.log_result("GET /department-head/patients", True, f"Successfully fetched {len(data)} patients")
         else:
             error_msg = response.text if response else "Connection failed"
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import "@/App.css";
 import { BrowserRouter, Routes, Route, Navigate } from "react-router-dom";
 import axios from "axios";
@@ -11,6 +11,7 @@ import LandingPage from "@/pages/LandingPage";
 import LoginPage from "@/pages/LoginPage";
 import RegisterPage from "@/pages/RegisterPage";
 import ForgotPasswordPage from "@/pages/ForgotPasswordPage";
+import ResetPasswordPage from "@/pages/ResetPasswordPage";
 
 // Patient Pages
 import PatientDashboard from "@/pages/patient/Dashboard";
@@ -49,6 +50,53 @@ function App() {
   const [user, setUser] = useState(null);
   const [token, setToken] = useState(localStorage.getItem("token"));
   const [loading, setLoading] = useState(true);
+  const refreshPromise = useRef(null);
+
+  // Access tokens are short-lived: on a 401, trade the refresh token for a new
+  // pair once (shared by concurrent requests) and replay the failed request.
+  useEffect(() => {
+    const interceptor = axios.interceptors.response.use(
+      (response) => response,
+      async (error) => {
+        const original = error.config;
+        const refreshToken = localStorage.getItem("refreshToken");
+        if (
+          error.response?.status !== 401 ||
+          !refreshToken ||
+          !original ||
+          original._retried ||
+          /\/auth\/(login|register|refresh|logout)$/.test(original.url || "")
+        ) {
+          return Promise.reject(error);
+        }
+
+        original._retried = true;
+        if (!refreshPromise.current) {
+          refreshPromise.current = axios
+            .post(`${API}/auth/refresh`, { refresh_token: refreshToken })
+            .then((response) => {
+              localStorage.setItem("token", response.data.token);
+              localStorage.setItem("refreshToken", response.data.refresh_token);
+              setToken(response.data.token);
+              return response.data.token;
+            })
+            .finally(() => {
+              refreshPromise.current = null;
+            });
+        }
+
+        try {
+          const newToken = await refreshPromise.current;
+          original.headers = { ...original.headers, Authorization: `Bearer ${newToken}` };
+          return axios(original);
+        } catch (refreshError) {
+          logout();
+          return Promise.reject(error);
+        }
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
+  }, []);
 
   useEffect(() => {
     if (token) {
@@ -72,14 +120,22 @@ function App() {
     }
   };
 
-  const login = (newToken, userData) => {
+  const login = (newToken, userData, refreshToken) => {
     localStorage.setItem("token", newToken);
+    if (refreshToken) {
+      localStorage.setItem("refreshToken", refreshToken);
+    }
     setToken(newToken);
     setUser(userData);
   };
 
   const logout = () => {
+    const refreshToken = localStorage.getItem("refreshToken");
+    if (refreshToken) {
+      axios.post(`${API}/auth/logout`, { refresh_token: refreshToken }).catch(() => {});
+    }
     localStorage.removeItem("token");
+    localStorage.removeItem("refreshToken");
     setToken(null);
     setUser(null);
   };
@@ -98,6 +154,7 @@ function App() {
               <Route path="/login" element={<LoginPage />} />
               <Route path="/register" element={<RegisterPage />} />
               <Route path="/forgot-password" element={<ForgotPasswordPage />} />
+              <Route path="/reset-password" element={<ResetPasswordPage />} />
 
             {/* Patient Routes */}
             <Route path="/patient/dashboard" element={user?.role === "patient" ? <PatientDashboard /> : <Navigate to="/login" />} />
@@ -141,6 +141,9 @@ export const translations = {
     patientManagement: 'Quản lý bệnh nhân',
     searchPatients: 'Tìm kiếm bệnh nhân...',
     registeredDate: 'Ngày đăng ký',
+    registeredFrom: 'Đăng ký từ ngày',
+    registeredTo: 'Đến ngày',
+    loadMore: 'Xem thêm',
     
     // Stats Page
     systemStatistics: 'Thống kê hệ thống',
@@ -359,6 +362,9 @@ export const translations = {
     patientManagement: 'Patient Management',
     searchPatients: 'Search patients...',
     registeredDate: 'Registered Date',
+    registeredFrom: 'Registered from',
+    registeredTo: 'To',
+    loadMore: 'Load more',
     
     // Stats Page
     systemStatistics: 'System Statistics',
@@ -33,7 +33,7 @@ export default function LoginPage() {
       };
       
       const response = await axios.post(`${API}/auth/login`, loginPayload);
-      const { token, user } = response.data;
+      const { token, refresh_token, user } = response.data;
       
       // Remember email if checkbox is checked
       if (rememberMe) {
@@ -42,7 +42,7 @@ export default function LoginPage() {
         localStorage.removeItem('rememberedEmail');
       }
       
-      login(token, user);
+      login(token, user, refresh_token);
       toast.success('Đăng nhập thành công!');
       
       // Redirect based on role
@@ -28,9 +28,9 @@ export default function RegisterPage() {
 
     try {
       const response = await axios.post(`${API}/auth/register`, formData);
-      const { token, user } = response.data;
+      const { token, refresh_token, user } = response.data;
       
-      login(token, user);
+      login(token, user, refresh_token);
       toast.success('Đăng ký thành công!');
       
       // Redirect based on role
@@ -0,0 +1,104 @@
+import React, { useState } from 'react';
+import { useNavigate, useSearchParams, Link } from 'react-router-dom';
+import { Button } from '@/components/ui/button';
+import { Input } from '@/components/ui/input';
+import { Label } from '@/components/ui/label';
+import { API } from '@/App';
+import { toast } from 'sonner';
+import axios from 'axios';
+import { Calendar, ArrowLeft } from 'lucide-react';
+
+export default function ResetPasswordPage() {
+  const navigate = useNavigate();
+  const [searchParams] = useSearchParams();
+  const [loading, setLoading] = useState(false);
+  const [newPassword, setNewPassword] = useState('');
+  const [confirmPassword, setConfirmPassword] = useState('');
+
+  const handleSubmit = async (e) => {
+    e.preventDefault();
+
+    if (newPassword !== confirmPassword) {
+      toast.error('Mật khẩu xác nhận không khớp');
+      return;
+    }
+
+    setLoading(true);
+
+    try {
+      await axios.post(`${API}/auth/reset-password`, {
+        token: searchParams.get('token') || '',
+        new_password: newPassword
+      });
+      toast.success('Đặt lại mật khẩu thành công! Vui lòng đăng nhập lại');
+      setTimeout(() => navigate('/login'), 2000);
+    } catch (error) {
+      const detail = error.response?.data?.detail;
+      toast.error(typeof detail === 'string' ? detail : 'Có lỗi xảy ra');
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  return (
+    <div className="min-h-screen bg-gradient-to-br from-cyan-50 via-teal-50 to-blue-50 flex items-center justify-center p-6">
+      <div className="w-full max-w-md">
+        <Button data-testid="back-to-login-btn" variant="ghost" onClick={() => navigate('/login')} className="mb-6">
+          <ArrowLeft className="w-4 h-4 mr-2" />
+          Về trang đăng nhập
+        </Button>
+        
+        <div className="bg-white rounded-3xl shadow-2xl p-8">
+          <div className="flex items-center justify-center gap-2 mb-8">
+            <div className="w-12 h-12 rounded-full bg-gradient-to-br from-teal-500 to-cyan-500 flex items-center justify-center">
+              <Calendar className="w-7 h-7 text-white" />
+            </div>
+            <span className="text-3xl font-bold text-gray-800">MediSchedule</span>
+          </div>
+
+          <h2 className="text-2xl font-bold text-center mb-4 text-gray-900">Đặt lại mật khẩu</h2>
+          <p className="text-center text-gray-600 mb-8">Nhập mật khẩu mới cho tài khoản của bạn</p>
+
+          <form onSubmit={handleSubmit} className="space-y-6">
+            <div>
+              <Label htmlFor="new_password">Mật khẩu mới</Label>
+              <Input
+                data-testid="new-password-input"
+                id="new_password"
+                type="password"
+                value={newPassword}
+                onChange={(e) => setNewPassword(e.target.value)}
+                required
+                className="mt-2"
+              />
+            </div>
+
+            <div>
+              <Label htmlFor="confirm_password">Xác nhận mật khẩu</Label>
+              <Input
+                data-testid="confirm-password-input"
+                id="confirm_password"
+                type="password"
+                value={confirmPassword}
+                onChange={(e) => setConfirmPassword(e.target.value)}
+                required
+                className="mt-2"
+              />
+            </div>
+
+            <Button data-testid="submit-reset-btn" type="submit" disabled={loading} className="w-full bg-gradient-to-r from-teal-500 to-cyan-500 hover:from-teal-600 hover:to-cyan-600">
+              {loading ? 'Đang xử lý...' : 'Đặt lại mật khẩu'}
+            </Button>
+          </form>
+
+          <p className="mt-6 text-center text-gray-600">
+            Link đã hết hạn?{' '}
+            <Link to="/forgot-password" className="text-teal-600 hover:text-teal-700 font-semibold">
+              Gửi lại link
+            </Link>
+          </p>
+        </div>
+      </div>
+    </div>
+  );
+}
@@ -29,7 +29,8 @@ export default function AdminDoctors() {
   const fetchDoctors = async () => {
     try {
       const response = await axios.get(`${API}/admin/doctors`, {
-        headers: { Authorization: `Bearer ${token}` }
+        headers: { Authorization: `Bearer ${token}` },
+        params: { fields: 'user_id,full_name,email,specialty_name,bio,experience_years,consultation_fee,status' }
       });
       setDoctors(response.data);
       setFilteredDoctors(response.data);
@@ -12,25 +12,33 @@ export default function AdminPatients() {
   const { token } = useContext(AuthContext);
   const { t } = useLanguage();
   const [patients, setPatients] = useState([]);
-  const [filteredPatients, setFilteredPatients] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [searchQuery, setSearchQuery] = useState('');
+  const [dateFrom, setDateFrom] = useState('');
+  const [dateTo, setDateTo] = useState('');
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-    fetchPatients();
-  }, []);
+    // Wait for the user to stop typing before searching
+    const timer = setTimeout(() => fetchPatients(), 300);
+    return () => clearTimeout(timer);
+  }, [searchQuery, dateFrom, dateTo]);
 
-  useEffect(() => {
-    filterPatients();
-  }, [searchQuery, patients]);
-
-  const fetchPatients = async () => {
+  const fetchPatients = async (cursor) => {
     try {
       const response = await axios.get(`${API}/admin/patients`, {
-        headers: { Authorization: `Bearer ${token}` }
+        headers: { Authorization: `Bearer ${token}` },
+        params: {
+          q: searchQuery || undefined,
+          created_from: dateFrom || undefined,
+          // The end date is inclusive, the API bound is exclusive
+          created_to: dateTo ? new Date(Date.parse(dateTo) + 86400000).toISOString().slice(0, 10) : undefined,
+          cursor,
+          fields: 'id,full_name,email,created_at'
+        }
       });
-      setPatients(response.data);
-      setFilteredPatients(response.data);
+      setPatients(cursor ? [...patients, ...response.data.items] : response.data.items);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       toast.error(t('loadError'));
     } finally {
@@ -52,19 +60,6 @@ export default function AdminPatients() {
     }
   };
 
-  const filterPatients = () => {
-    if (searchQuery) {
-      setFilteredPatients(
-        patients.filter(p => 
-          p.full_name?.toLowerCase().includes(searchQuery.toLowerCase()) ||
-          p.email?.toLowerCase().includes(searchQuery.toLowerCase())
-        )
-      );
-    } else {
-      setFilteredPatients(patients);
-    }
-  };
-
   return (
     <Layout>
       <div className="min-h-screen bg-gradient-to-br from-cyan-50 via-teal-50 to-blue-50 p-6">
@@ -83,12 +78,22 @@ export default function AdminPatients() {
                 className="pl-10"
               />
             </div>
+            <div className="grid md:grid-cols-2 gap-4 mt-4">
+              <div>
+                <label className="text-sm text-gray-600">{t('registeredFrom')}</label>
+                <Input data-testid="date-from-input" type="date" value={dateFrom} onChange={(e) => setDateFrom(e.target.value)} className="mt-1" />
+              </div>
+              <div>
+                <label className="text-sm text-gray-600">{t('registeredTo')}</label>
+                <Input data-testid="date-to-input" type="date" value={dateTo} onChange={(e) => setDateTo(e.target.value)} className="mt-1" />
+              </div>
+            </div>
           </div>
 
           {/* Patients List */}
           {loading ? (
             <p className="text-center text-gray-500">{t('loading')}</p>
-          ) : filteredPatients.length === 0 ? (
+          ) : patients.length === 0 ? (
             <div className="bg-white rounded-2xl p-12 text-center">
               <Search className="w-16 h-16 text-gray-300 mx-auto mb-4" />
               <p className="text-gray-500">{t('noData')}</p>
@@ -105,7 +110,7 @@ export default function AdminPatients() {
                   </tr>
                 </thead>
                 <tbody>
-                  {filteredPatients.map((patient, index) => (
+                  {patients.map((patient, index) => (
                     <tr key={patient.id} className={`border-b ${index % 2 === 0 ? 'bg-white' : 'bg-gray-50'} hover:bg-teal-50 transition-colors`}>
                       <td className="px-6 py-4">
                         <div className="flex items-center gap-3">
@@ -137,8 +142,16 @@ export default function AdminPatients() {
             </div>
           )}
 
+          {nextCursor && (
+            <div className="mt-6 text-center">
+              <Button data-testid="load-more-btn" variant="outline" onClick={() => fetchPatients(nextCursor)}>
+                {t('loadMore')}
+              </Button>
+            </div>
+          )}
+
           <div className="mt-6 text-center text-gray-600">
-            {t('totalPatients')}: <span className="font-bold text-teal-600">{filteredPatients.length}</span>
+            {t('totalPatients')}: <span className="font-bold text-teal-600">{patients.length}</span>
           </div>
         </div>
       </div>
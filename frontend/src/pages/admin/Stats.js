@@ -8,12 +8,18 @@ import { Users, Calendar, CheckCircle, XCircle, Clock, TrendingUp } from 'lucide
 export default function AdminStats() {
   const { token } = useContext(AuthContext);
   const [stats, setStats] = useState(null);
+  const [trend, setTrend] = useState(null);
+  const [trendDays, setTrendDays] = useState(30);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
     fetchStats();
   }, []);
 
+  useEffect(() => {
+    fetchTrend();
+  }, [trendDays]);
+
   const fetchStats = async () => {
     try {
       const response = await axios.get(`${API}/admin/stats`, {
@@ -27,6 +33,19 @@ export default function AdminStats() {
     }
   };
 
+  const fetchTrend = async () => {
+    const dateFrom = new Date(Date.now() - (trendDays - 1) * 86400000).toISOString().slice(0, 10);
+    try {
+      const response = await axios.get(`${API}/admin/analytics/appointments`, {
+        headers: { Authorization: `Bearer ${token}` },
+        params: { date_from: dateFrom }
+      });
+      setTrend(response.data);
+    } catch (error) {
+      toast.error('Không thể tải xu hướng lịch hẹn');
+    }
+  };
+
   if (loading) {
     return (
       <Layout>
@@ -127,6 +146,28 @@ export default function AdminStats() {
             </div>
           </div>
 
+          {/* Appointment Trend */}
+          {trend && (
+            <div className="mb-8">
+              <div className="flex justify-between items-center mb-4">
+                <h2 className="text-xl font-bold text-gray-900">Xu hướng lịch hẹn</h2>
+                <div className="flex gap-2">
+                  {[7, 30, 90].map(days => (
+                    <button
+                      key={days}
+                      data-testid={`trend-${days}-btn`}
+                      onClick={() => setTrendDays(days)}
+                      className={`px-3 py-1 rounded-lg text-sm ${trendDays === days ? 'bg-teal-500 text-white' : 'bg-white text-gray-600'}`}
+                    >
+                      {days} ngày
+                    </button>
+                  ))}
+                </div>
+              </div>
+              <TrendChart trend={trend} />
+            </div>
+          )}
+
           {/* Doctor Approval Stats */}
           <div>
             <h2 className="text-xl font-bold text-gray-900 mb-4">Trạng thái duyệt bác sĩ</h2>
@@ -153,6 +194,35 @@ export default function AdminStats() {
   );
 }
 
+function TrendChart({ trend }) {
+  const max = Math.max(1, ...trend.daily.map(point => point.created));
+
+  return (
+    <div data-testid="appointment-trend" className="bg-white rounded-2xl p-6 shadow-lg">
+      <div className="flex gap-6 mb-4 text-sm">
+        <span className="text-teal-600">Đặt mới: <b>{trend.totals.created}</b></span>
+        <span className="text-blue-600">Hoàn thành: <b>{trend.totals.completed}</b></span>
+        <span className="text-red-600">Đã hủy: <b>{trend.totals.cancelled}</b></span>
+      </div>
+      <div className="flex items-end gap-px h-40">
+        {trend.daily.map(point => (
+          <div
+            key={point.day}
+            title={`${point.day}: ${point.created} đặt mới, ${point.completed} hoàn thành, ${point.cancelled} đã hủy`}
+            className="flex-1 flex flex-col justify-end h-full"
+          >
+            <div className="bg-teal-400 rounded-t" style={{ height: `${(point.created / max) * 100}%` }} />
+          </div>
+        ))}
+      </div>
+      <div className="flex justify-between text-xs text-gray-500 mt-2">
+        <span>{trend.date_from}</span>
+        <span>{trend.date_to}</span>
+      </div>
+    </div>
+  );
+}
+
 function StatCard({ icon, title, value, color, testId }) {
   return (
     <div data-testid={testId} className="bg-white rounded-2xl p-6 shadow-lg hover:shadow-xl transition-all">
@@ -26,7 +26,8 @@ export default function Doctors() {
     try {
       const token = localStorage.getItem('token');
       const response = await axios.get(`${API_BASE_URL}/api/department-head/doctors`, {
-        headers: { Authorization: `Bearer ${token}` }
+        headers: { Authorization: `Bearer ${token}` },
+        params: { fields: 'user_id,user_info,specialty_name,experience_years,consultation_fee,status' }
       });
       setDoctors(response.data);
     } catch (error) {
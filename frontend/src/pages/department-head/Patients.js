@@ -9,25 +9,25 @@ const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001
 export default function Patients() {
   const { t } = useLanguage();
   const [patients, setPatients] = useState([]);
-  const [filteredPatients, setFilteredPatients] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
 
   useEffect(() => {
-    fetchPatients();
-  }, []);
+    // Wait for the user to stop typing before searching
+    const timer = setTimeout(() => fetchPatients(), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
 
-  useEffect(() => {
-    filterPatients();
-  }, [patients, searchTerm]);
-
-  const fetchPatients = async () => {
+  const fetchPatients = async (cursor) => {
     try {
       const token = localStorage.getItem('token');
       const response = await axios.get(`${API_BASE_URL}/api/department-head/patients`, {
-        headers: { Authorization: `Bearer ${token}` }
+        headers: { Authorization: `Bearer ${token}` },
+        params: { q: searchTerm || undefined, cursor }
       });
-      setPatients(response.data);
+      setPatients(cursor ? [...patients, ...response.data.items] : response.data.items);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       toast.error(t('errorFetchingPatients'));
     } finally {
@@ -35,20 +35,6 @@ export default function Patients() {
     }
   };
 
-  const filterPatients = () => {
-    let filtered = [...patients];
-
-    if (searchTerm) {
-      filtered = filtered.filter(patient =>
-        patient.full_name?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        patient.email?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        patient.phone?.includes(searchTerm)
-      );
-    }
-
-    setFilteredPatients(filtered);
-  };
-
   const handleDelete = async (patientId) => {
     if (!window.confirm(t('confirmDeletePatient'))) return;
 
@@ -117,12 +103,12 @@ export default function Patients() {
 
       {/* Patients Grid */}
       <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
-        {filteredPatients.length === 0 ? (
+        {patients.length === 0 ? (
           <div className="col-span-full bg-white rounded-lg shadow-md p-8 text-center text-gray-500">
             {t('noPatientsFound')}
           </div>
         ) : (
-          filteredPatients.map((patient) => (
+          patients.map((patient) => (
             <div key={patient.id} className="bg-white rounded-lg shadow-md hover:shadow-lg transition-shadow">
               <div className="p-6">
                 {/* Patient Info */}
@@ -176,8 +162,19 @@ export default function Patients() {
         )}
       </div>
 
+      {nextCursor && (
+        <div className="text-center">
+          <button
+            onClick={() => fetchPatients(nextCursor)}
+            className="px-4 py-2 border border-gray-300 rounded-lg text-gray-700 hover:bg-gray-50"
+          >
+            {t('loadMore')}
+          </button>
+        </div>
+      )}
+
       {/* Empty State with Info */}
-      {filteredPatients.length === 0 && patients.length > 0 && (
+      {patients.length === 0 && searchTerm && (
         <div className="bg-blue-50 border border-blue-200 rounded-lg p-4">
           <p className="text-blue-800 text-sm">
             {t('noResultsForSearch')}
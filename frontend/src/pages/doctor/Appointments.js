@@ -59,24 +59,55 @@ export default function DoctorAppointments() {
     }
   };
 
+  const handleConfirmAllPending = async () => {
+    const pending = appointments.filter(a => a.status === 'pending');
+    if (pending.length === 0) return;
+    try {
+      const response = await axios.put(`${API}/appointments/status:batch`,
+        { items: pending.map(a => ({ appointment_id: a.id, status: 'confirmed' })) },
+        { headers: { Authorization: `Bearer ${token}` } }
+      );
+      const failed = response.data.results.filter(r => r.result !== 'updated').length;
+      if (failed > 0) {
+        toast.warning(`Đã xác nhận ${response.data.updated} lịch hẹn, ${failed} lịch hẹn không thể cập nhật`);
+      } else {
+        toast.success(`Đã xác nhận ${response.data.updated} lịch hẹn`);
+      }
+      fetchAppointments();
+    } catch (error) {
+      toast.error(error.response?.data?.detail || 'Cập nhật thất bại');
+    }
+  };
+
   return (
     <Layout>
       <div className="min-h-screen bg-gradient-to-br from-cyan-50 via-teal-50 to-blue-50 p-6">
         <div className="max-w-5xl mx-auto">
           <div className="flex justify-between items-center mb-8">
             <h1 className="text-3xl font-bold text-gray-900">Quản lý lịch hẹn</h1>
-            <Select value={statusFilter} onValueChange={setStatusFilter}>
-              <SelectTrigger data-testid="status-filter" className="w-48">
-                <SelectValue />
-              </SelectTrigger>
-              <SelectContent>
-                <SelectItem value="all">Tất cả</SelectItem>
-                <SelectItem value="pending">Chờ xác nhận</SelectItem>
-                <SelectItem value="confirmed">Đã xác nhận</SelectItem>
-                <SelectItem value="completed">Hoàn thành</SelectItem>
-                <SelectItem value="cancelled">Đã hủy</SelectItem>
-              </SelectContent>
-            </Select>
+            <div className="flex items-center gap-3">
+              {appointments.some(a => a.status === 'pending') && (
+                <Button
+                  data-testid="confirm-all-pending"
+                  onClick={handleConfirmAllPending}
+                  className="bg-green-600 hover:bg-green-700"
+                >
+                  Xác nhận tất cả
+                </Button>
+              )}
+              <Select value={statusFilter} onValueChange={setStatusFilter}>
+                <SelectTrigger data-testid="status-filter" className="w-48">
+                  <SelectValue />
+                </SelectTrigger>
+                <SelectContent>
+                  <SelectItem value="all">Tất cả</SelectItem>
+                  <SelectItem value="pending">Chờ xác nhận</SelectItem>
+                  <SelectItem value="confirmed">Đã xác nhận</SelectItem>
+                  <SelectItem value="completed">Hoàn thành</SelectItem>
+                  <SelectItem value="cancelled">Đã hủy</SelectItem>
+                </SelectContent>
+              </Select>
+            </div>
           </div>
 
           {loading ? (
@@ -6,6 +6,7 @@ import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
 import { Textarea } from '@/components/ui/textarea';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
+import { Checkbox } from '@/components/ui/checkbox';
 import { toast } from 'sonner';
 import Layout from '@/components/Layout';
 import { User } from 'lucide-react';
@@ -20,7 +21,8 @@ export default function DoctorProfile() {
     specialty_id: '',
     bio: '',
     experience_years: 0,
-    consultation_fee: 0
+    consultation_fee: 0,
+    appointment_types: ['in_person', 'online']
   });
 
   useEffect(() => {
@@ -39,7 +41,8 @@ export default function DoctorProfile() {
         specialty_id: profileRes.data.specialty_id || '',
         bio: profileRes.data.bio || '',
         experience_years: profileRes.data.experience_years || 0,
-        consultation_fee: profileRes.data.consultation_fee || 0
+        consultation_fee: profileRes.data.consultation_fee || 0,
+        appointment_types: profileRes.data.appointment_types || ['in_person', 'online']
       });
     } catch (error) {
       toast.error('Không thể tải thông tin');
@@ -48,6 +51,16 @@ export default function DoctorProfile() {
     }
   };
 
+  const toggleAppointmentType = (type, checked) => {
+    const types = checked
+      ? [...formData.appointment_types, type]
+      : formData.appointment_types.filter(t => t !== type);
+    // At least one type must stay selected
+    if (types.length > 0) {
+      setFormData({ ...formData, appointment_types: types });
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     setSaving(true);
@@ -155,6 +168,28 @@ export default function DoctorProfile() {
                 />
               </div>
 
+              <div>
+                <Label>Hình thức khám</Label>
+                <div className="flex gap-6 mt-2">
+                  <label className="flex items-center gap-2 text-sm">
+                    <Checkbox
+                      data-testid="in-person-checkbox"
+                      checked={formData.appointment_types.includes('in_person')}
+                      onCheckedChange={(checked) => toggleAppointmentType('in_person', checked)}
+                    />
+                    Khám trực tiếp
+                  </label>
+                  <label className="flex items-center gap-2 text-sm">
+                    <Checkbox
+                      data-testid="online-checkbox"
+                      checked={formData.appointment_types.includes('online')}
+                      onCheckedChange={(checked) => toggleAppointmentType('online', checked)}
+                    />
+                    Tư vấn online
+                  </label>
+                </div>
+              </div>
+
               <Button data-testid="save-profile-btn" type="submit" disabled={saving} className="w-full bg-gradient-to-r from-teal-500 to-cyan-500 hover:from-teal-600 hover:to-cyan-600">
                 {saving ? 'Đang lưu...' : 'Lưu thay đổi'}
               </Button>
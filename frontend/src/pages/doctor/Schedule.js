@@ -7,7 +7,7 @@ import { Label } from '@/components/ui/label';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import { toast } from 'sonner';
 import Layout from '@/components/Layout';
-import { Plus, Trash2, Clock } from 'lucide-react';
+import { Plus, Trash2, Clock, CalendarPlus } from 'lucide-react';
 
 export default function DoctorSchedule() {
   const { user, token } = useContext(AuthContext);
@@ -59,6 +59,19 @@ export default function DoctorSchedule() {
     }
   };
 
+  const handleCalendarFeed = async () => {
+    try {
+      const response = await axios.post(`${API}/doctors/calendar-feed`, {}, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      const feedUrl = API.replace(/\/api$/, '') + response.data.url;
+      await navigator.clipboard.writeText(feedUrl);
+      toast.success('Đã sao chép liên kết lịch. Thêm liên kết này vào Google Calendar/Outlook để đồng bộ lịch hẹn.');
+    } catch (error) {
+      toast.error(error.response?.data?.detail || 'Không thể tạo liên kết lịch');
+    }
+  };
+
   const dayNames = {
     monday: 'Thứ 2',
     tuesday: 'Thứ 3',
@@ -85,10 +98,16 @@ export default function DoctorSchedule() {
         <div className="max-w-4xl mx-auto">
           <div className="flex justify-between items-center mb-8">
             <h1 className="text-3xl font-bold text-gray-900">Lịch làm việc</h1>
-            <Button data-testid="add-slot-btn" onClick={addSlot} className="bg-gradient-to-r from-teal-500 to-cyan-500">
-              <Plus className="w-4 h-4 mr-2" />
-              Thêm khung giờ
-            </Button>
+            <div className="flex gap-3">
+              <Button data-testid="calendar-feed-btn" variant="outline" onClick={handleCalendarFeed}>
+                <CalendarPlus className="w-4 h-4 mr-2" />
+                Đồng bộ lịch
+              </Button>
+              <Button data-testid="add-slot-btn" onClick={addSlot} className="bg-gradient-to-r from-teal-500 to-cyan-500">
+                <Plus className="w-4 h-4 mr-2" />
+                Thêm khung giờ
+              </Button>
+            </div>
           </div>
 
           <div className="bg-white rounded-3xl shadow-xl p-8">
@@ -12,58 +12,68 @@ import { toast } from 'sonner';
 import { Search, MapPin, Star, Calendar } from 'lucide-react';
 import Layout from '@/components/Layout';
 
+const PAGE_SIZE = 12;
+
 export default function SearchDoctors() {
   const { token } = useContext(AuthContext);
   const [specialties, setSpecialties] = useState([]);
   const [doctors, setDoctors] = useState([]);
-  const [filteredDoctors, setFilteredDoctors] = useState([]);
+  const [total, setTotal] = useState(0);
+  const [page, setPage] = useState(1);
   const [selectedSpecialty, setSelectedSpecialty] = useState('all');
   const [searchQuery, setSearchQuery] = useState('');
+  const [sortBy, setSortBy] = useState('relevance');
+  const [appointmentType, setAppointmentType] = useState('all');
   const [selectedDoctor, setSelectedDoctor] = useState(null);
   const [showBooking, setShowBooking] = useState(false);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-    fetchData();
+    fetchSpecialties();
   }, []);
 
   useEffect(() => {
-    filterDoctors();
-  }, [selectedSpecialty, searchQuery, doctors]);
+    setPage(1);
+  }, [selectedSpecialty, searchQuery, sortBy, appointmentType]);
+
+  useEffect(() => {
+    // Wait for the user to stop typing before searching
+    const timer = setTimeout(searchDoctors, 300);
+    return () => clearTimeout(timer);
+  }, [selectedSpecialty, searchQuery, sortBy, appointmentType, page]);
 
-  const fetchData = async () => {
+  const fetchSpecialties = async () => {
     try {
-      const [specialtiesRes, doctorsRes] = await Promise.all([
-        axios.get(`${API}/specialties`),
-        axios.get(`${API}/doctors`)
-      ]);
-      setSpecialties(specialtiesRes.data);
-      setDoctors(doctorsRes.data);
-      setFilteredDoctors(doctorsRes.data);
+      const response = await axios.get(`${API}/specialties`);
+      setSpecialties(response.data);
     } catch (error) {
       toast.error('Không thể tải dữ liệu');
-    } finally {
-      setLoading(false);
     }
   };
 
-  const filterDoctors = () => {
-    let filtered = doctors;
-
-    if (selectedSpecialty !== 'all') {
-      filtered = filtered.filter(d => d.specialty_id === selectedSpecialty);
-    }
-
-    if (searchQuery) {
-      filtered = filtered.filter(d => 
-        d.full_name?.toLowerCase().includes(searchQuery.toLowerCase()) ||
-        d.specialty_name?.toLowerCase().includes(searchQuery.toLowerCase())
-      );
+  const searchDoctors = async () => {
+    try {
+      const response = await axios.get(`${API}/doctors/search`, {
+        params: {
+          q: searchQuery,
+          specialty_id: selectedSpecialty !== 'all' ? selectedSpecialty : undefined,
+          sort: sortBy !== 'relevance' ? sortBy : undefined,
+          appointment_type: appointmentType !== 'all' ? appointmentType : undefined,
+          page,
+          page_size: PAGE_SIZE
+        }
+      });
+      setDoctors(response.data.items);
+      setTotal(response.data.total);
+    } catch (error) {
+      toast.error('Không thể tải dữ liệu');
+    } finally {
+      setLoading(false);
     }
-
-    setFilteredDoctors(filtered);
   };
 
+  const totalPages = Math.ceil(total / PAGE_SIZE);
+
   const handleBookAppointment = (doctor) => {
     setSelectedDoctor(doctor);
     setShowBooking(true);
@@ -77,14 +87,14 @@ export default function SearchDoctors() {
 
           {/* Filters */}
           <div className="bg-white rounded-2xl shadow-lg p-6 mb-8">
-            <div className="grid md:grid-cols-2 gap-4">
+            <div className="grid md:grid-cols-4 gap-4">
               <div>
                 <Label>Tìm kiếm</Label>
                 <div className="relative mt-2">
                   <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 text-gray-400 w-5 h-5" />
                   <Input
                     data-testid="search-input"
-                    placeholder="Tìm theo tên bác sĩ hoặc chuyên khoa..."
+                    placeholder="Tìm theo tên bác sĩ, chuyên khoa hoặc giới thiệu..."
                     value={searchQuery}
                     onChange={(e) => setSearchQuery(e.target.value)}
                     className="pl-10"
@@ -105,23 +115,63 @@ export default function SearchDoctors() {
                   </SelectContent>
                 </Select>
               </div>
+              <div>
+                <Label>Hình thức khám</Label>
+                <Select value={appointmentType} onValueChange={setAppointmentType}>
+                  <SelectTrigger data-testid="appointment-type-filter" className="mt-2">
+                    <SelectValue />
+                  </SelectTrigger>
+                  <SelectContent>
+                    <SelectItem value="all">Tất cả hình thức</SelectItem>
+                    <SelectItem value="in_person">Khám trực tiếp</SelectItem>
+                    <SelectItem value="online">Tư vấn online</SelectItem>
+                  </SelectContent>
+                </Select>
+              </div>
+              <div>
+                <Label>Sắp xếp</Label>
+                <Select value={sortBy} onValueChange={setSortBy}>
+                  <SelectTrigger data-testid="sort-select" className="mt-2">
+                    <SelectValue />
+                  </SelectTrigger>
+                  <SelectContent>
+                    <SelectItem value="relevance">Phù hợp nhất</SelectItem>
+                    <SelectItem value="consultation_fee">Phí tư vấn thấp nhất</SelectItem>
+                    <SelectItem value="-consultation_fee">Phí tư vấn cao nhất</SelectItem>
+                    <SelectItem value="-experience_years">Nhiều kinh nghiệm nhất</SelectItem>
+                  </SelectContent>
+                </Select>
+              </div>
             </div>
           </div>
 
           {/* Doctors Grid */}
           {loading ? (
             <p className="text-center text-gray-500">Đang tải...</p>
-          ) : filteredDoctors.length === 0 ? (
+          ) : doctors.length === 0 ? (
             <div className="text-center py-12 bg-white rounded-2xl">
               <Search className="w-16 h-16 text-gray-300 mx-auto mb-4" />
               <p className="text-gray-500">Không tìm thấy bác sĩ phù hợp</p>
             </div>
           ) : (
-            <div className="grid md:grid-cols-2 lg:grid-cols-3 gap-6">
-              {filteredDoctors.map(doctor => (
-                <DoctorCard key={doctor.user_id} doctor={doctor} onBook={handleBookAppointment} />
-              ))}
-            </div>
+            <>
+              <div className="grid md:grid-cols-2 lg:grid-cols-3 gap-6">
+                {doctors.map(doctor => (
+                  <DoctorCard key={doctor.user_id} doctor={doctor} onBook={handleBookAppointment} />
+                ))}
+              </div>
+              {totalPages > 1 && (
+                <div className="flex justify-center items-center gap-4 mt-8">
+                  <Button data-testid="prev-page-btn" variant="outline" disabled={page <= 1} onClick={() => setPage(page - 1)}>
+                    Trang trước
+                  </Button>
+                  <span className="text-gray-600">Trang {page}/{totalPages}</span>
+                  <Button data-testid="next-page-btn" variant="outline" disabled={page >= totalPages} onClick={() => setPage(page + 1)}>
+                    Trang sau
+                  </Button>
+                </div>
+              )}
+            </>
           )}
         </div>
       </div>